@@ -19,8 +19,8 @@ def last_news(conn: PGConnection, min_unix_time):
     FROM (
         SELECT * FROM messages WHERE date_unix >= %s
     ) m 
-    LEFT JOIN message_sentiment s ON m.channel = s.channel AND m.id = s.id
-    RIGHT JOIN message_tag t ON m.channel = t.channel AND m.id = t.id;
+    LEFT JOIN message_sentiment s ON m.channel = s.channel AND m.id = s.id AND m.date_unix = s.date_unix
+    RIGHT JOIN message_tag t ON m.channel = t.channel AND m.id = t.id AND m.date_unix = t.date_unix;
     """
     cursor = conn.cursor()
     cursor.execute(query, (min_unix_time,))
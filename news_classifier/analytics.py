@@ -0,0 +1,311 @@
+"""
+Local analytics over snapshots of messages + sentiment + tags.
+
+`snapshot` copies the joined rows out of PostgreSQL once, month by month,
+into Parquet files (<dir>/month=YYYY-MM/data.parquet). Everything else runs
+in embedded DuckDB over those files, so exploratory queries never touch the
+production database. Later snapshots re-export the last exported month (it
+may have been incomplete), the months after it, and older months that got
+sentiment or tag scores since the previous snapshot (created_at, e.g. after a
+backfill or a new label), unless --full. Backfilled messages that are not
+scored yet show up once they are.
+
+Aggregations follow bayesian_sentiment_script.Rmd: weeks start on Monday in
+Europe/Madrid, sentiment S = positive - negative, and category weights below
+cat_threshold are set to 0. For week t and category j, n[t,j] = sum(C) and
+y[t,j] = sum(S * C) / n[t,j].
+
+Usage:
+  python -m news_classifier.analytics snapshot [--since 2024-01] [--full]
+  python -m news_classifier.analytics weekly [--by-channel]
+  python -m news_classifier.analytics categories --cat-threshold 0.25
+  python -m news_classifier.analytics sweep --thresholds 0.1,0.2,0.25,0.3,0.4
+  python -m news_classifier.analytics heatmap --cat-threshold 0.25 [--csv out.csv]
+"""
+from typing import List, Sequence, Set, Tuple
+import glob
+import json
+import logging
+import os
+import time
+
+import duckdb
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import connection as PGConnection
+
+from news_classifier.partitions import add_months, month_bounds, month_of
+from news_classifier.tag.database import get_labels
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = "snapshot"
+TIMEZONE = "Europe/Madrid"
+
+
+def _exported_months(path: str) -> List[str]:
+    return sorted(os.path.basename(os.path.dirname(f))[len("month="):] for f in glob.glob(f"{path}/month=*/data.parquet"))
+
+
+def _state_path(path: str) -> str:
+    return os.path.join(path, "_snapshot.json")
+
+
+def _rescored_months(conn: PGConnection, since: int) -> Set[Tuple[int, int]]:
+    # UTC months, like the partitions and the export files
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT DISTINCT EXTRACT(YEAR FROM d)::INT, EXTRACT(MONTH FROM d)::INT
+        FROM (
+            SELECT to_timestamp(date_unix) AT TIME ZONE 'UTC' AS d FROM message_sentiment WHERE created_at >= %s
+            UNION ALL
+            SELECT to_timestamp(date_unix) AT TIME ZONE 'UTC' FROM message_tag_score WHERE created_at >= %s
+        ) t
+        """,
+        (since, since),
+    )
+    return {(int(y), int(m)) for y, m in cur.fetchall()}
+
+
+def snapshot(conn: PGConnection, path: str = SNAPSHOT_DIR, since: str | None = None, full: bool = False) -> int:
+    """
+    Export the messages/sentiment/tag join to Parquet, one file per month.
+    Returns number of rows written.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(date_unix), MAX(date_unix) FROM messages")
+    lo, hi = cur.fetchone()
+    if lo is None:
+        return 0
+    started_at = int(time.time())
+    (y, m), last = month_of(lo), month_of(hi)
+    done = [] if full else _exported_months(path)
+    touched: Set[Tuple[int, int]] = set()
+    if since is not None:
+        y, m = (int(x) for x in since.split("-"))
+    elif done:
+        # The last exported month may have been partial
+        y, m = (int(x) for x in done[-1].split("-"))
+        try:
+            with open(_state_path(path)) as f:
+                touched = _rescored_months(conn, int(json.load(f)["exported_at"]))
+        except (OSError, ValueError, KeyError):
+            # No record of the previous export time: re-export everything
+            y, m = month_of(lo)
+    months = set()
+    while (y, m) <= last:
+        months.add((y, m))
+        y, m = add_months(y, m, 1)
+    months |= {ym for ym in touched if ym <= last}
+
+    labels = get_labels(conn)
+    tag_cols = sql.SQL("").join(
+        sql.SQL(", t.") + sql.Identifier(c) for c in labels["column_name"]
+    )
+    # Pivot only the month's scores; joining the message_tag view would
+    # aggregate all of message_tag_score for every month
+    pivot = sql.SQL("").join(
+        sql.SQL(", MAX(score) FILTER (WHERE label_id = {}) AS {}").format(sql.Literal(int(lid)), sql.Identifier(col))
+        for lid, col in zip(labels["label_id"], labels["column_name"])
+    )
+    query = sql.SQL(
+        """
+        SELECT m.channel, m.id, m.date_unix, s.positive, s.neutral, s.negative{tag_cols}
+        FROM messages m
+        LEFT JOIN message_sentiment s ON m.channel = s.channel AND m.id = s.id AND m.date_unix = s.date_unix
+        LEFT JOIN (
+            SELECT channel, id, date_unix{pivot}
+            FROM message_tag_score
+            WHERE date_unix >= %s AND date_unix < %s
+            GROUP BY channel, id, date_unix
+        ) t ON m.channel = t.channel AND m.id = t.id AND m.date_unix = t.date_unix
+        WHERE m.date_unix >= %s AND m.date_unix < %s
+        """
+    ).format(tag_cols=tag_cols, pivot=pivot).as_string(conn)
+
+    con = duckdb.connect()
+    total = 0
+    for y, m in sorted(months):
+        start, end = month_bounds(y, m)
+        df = pd.read_sql_query(query, conn, params=[start, end, start, end])
+        out_dir = os.path.join(path, f"month={y:04d}-{m:02d}")
+        os.makedirs(out_dir, exist_ok=True)
+        tmp = os.path.join(out_dir, "data.parquet.tmp")
+        con.from_df(df).write_parquet(tmp)
+        os.replace(tmp, os.path.join(out_dir, "data.parquet"))
+        logger.info(f"{y}-{m:02d}: {len(df)} rows")
+        total += len(df)
+    con.close()
+    os.makedirs(path, exist_ok=True)
+    with open(_state_path(path), "w") as f:
+        json.dump({"exported_at": started_at}, f)
+    return total
+
+
+def connect(path: str = SNAPSHOT_DIR) -> duckdb.DuckDBPyConnection:
+    """
+    In-memory DuckDB with views over a snapshot:
+      news(channel, id, date_unix, positive, neutral, negative, <tag columns>, week_start, s)
+      news_category(channel, id, week_start, s, category, score)  -- one row per message and category
+    """
+    files = glob.glob(f"{path}/month=*/data.parquet")
+    if not files:
+        raise ValueError(f"No snapshot under {path}; run `python -m news_classifier.analytics snapshot` first")
+    con = duckdb.connect()
+    con.execute(f"SET TimeZone = '{TIMEZONE}'")
+    pattern = f"{path}/month=*/data.parquet".replace("'", "''")
+    con.execute(
+        f"""
+        CREATE VIEW news AS
+        SELECT * EXCLUDE (month),
+               date_trunc('week', to_timestamp(date_unix))::DATE AS week_start,
+               positive - negative AS s
+        FROM read_parquet('{pattern}', hive_partitioning = true, union_by_name = true)
+        """
+    )
+    con.execute(
+        """
+        CREATE VIEW news_category AS
+        SELECT channel, id, week_start, s, category, score
+        FROM (UNPIVOT (SELECT * EXCLUDE (date_unix, positive, neutral, negative) FROM news)
+              ON COLUMNS(* EXCLUDE (channel, id, week_start, s))
+              INTO NAME category VALUE score)
+        """
+    )
+    return con
+
+
+def weekly_means(con: duckdb.DuckDBPyConnection, by_channel: bool = False) -> pd.DataFrame:
+    """
+    Mean sentiment per week (and channel). Messages without sentiment are skipped.
+    """
+    keys = "channel, week_start" if by_channel else "week_start"
+    return con.execute(
+        f"""
+        SELECT {keys}, COUNT(*) AS n_messages,
+               AVG(positive) AS positive, AVG(neutral) AS neutral, AVG(negative) AS negative, AVG(s) AS sentiment
+        FROM news
+        WHERE s IS NOT NULL
+        GROUP BY ALL
+        ORDER BY ALL
+        """
+    ).df()
+
+
+def category_sentiment(
+    con: duckdb.DuckDBPyConnection, cat_threshold: float = 0.25, exclude: Sequence[str] = ()
+) -> pd.DataFrame:
+    """
+    Per week and category: n = sum(C) and y = sum(S*C)/n with C < cat_threshold
+    set to 0 (the y / n matrices of the Rmd, in long format; y is NULL when n = 0).
+    """
+    out = con.execute(
+        """
+        SELECT week_start, category,
+               SUM(c) AS n,
+               SUM(s * c) / NULLIF(SUM(c), 0) AS y
+        FROM (
+            SELECT week_start, category, s,
+                   CASE WHEN score >= $threshold THEN score ELSE 0 END AS c
+            FROM news_category
+            WHERE s IS NOT NULL AND score IS NOT NULL
+        )
+        GROUP BY ALL
+        ORDER BY ALL
+        """,
+        {"threshold": cat_threshold},
+    ).df()
+    return out[~out["category"].isin(list(exclude))].reset_index(drop=True)
+
+
+def threshold_sweep(con: duckdb.DuckDBPyConnection, thresholds: Sequence[float]) -> pd.DataFrame:
+    """
+    For each cat_threshold and category: share of messages kept (score >= threshold),
+    mean weekly weight n, and number of weeks with n = 0 (gaps in y).
+    """
+    return con.execute(
+        """
+        WITH weekly AS (
+            SELECT thr.threshold, week_start, category,
+                   SUM(CASE WHEN score >= thr.threshold THEN score ELSE 0 END) AS n,
+                   COUNT(*) FILTER (WHERE score >= thr.threshold) AS kept,
+                   COUNT(*) AS messages
+            FROM news_category, (SELECT unnest($thresholds) AS threshold) thr
+            WHERE s IS NOT NULL AND score IS NOT NULL
+            GROUP BY ALL
+        )
+        SELECT threshold, category,
+               SUM(kept) / SUM(messages) AS share_kept,
+               AVG(n) AS mean_weekly_n,
+               COUNT(*) FILTER (WHERE n = 0) AS empty_weeks,
+               COUNT(*) AS weeks
+        FROM weekly
+        GROUP BY ALL
+        ORDER BY ALL
+        """,
+        {"thresholds": [float(t) for t in thresholds]},
+    ).df()
+
+
+def category_heatmap(con: duckdb.DuckDBPyConnection, cat_threshold: float = 0.25) -> pd.DataFrame:
+    """
+    Mean thresholded category score per week, pivoted to weeks x categories
+    (the df_Ct heatmap of the Rmd).
+    """
+    long = con.execute(
+        """
+        SELECT week_start, category,
+               AVG(CASE WHEN score >= $threshold THEN score ELSE 0 END) AS mean_score
+        FROM news_category
+        WHERE score IS NOT NULL
+        GROUP BY ALL
+        ORDER BY ALL
+        """,
+        {"threshold": cat_threshold},
+    ).df()
+    return long.pivot(index="week_start", columns="category", values="mean_score")
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--path", default=SNAPSHOT_DIR, help="Snapshot directory")
+    parser.add_argument("--csv", default=None, help="Write the result to this CSV instead of printing it")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_snap = sub.add_parser("snapshot", help="Export the join from PostgreSQL to Parquet")
+    p_snap.add_argument("--since", default=None, help="YYYY-MM: re-export from this month")
+    p_snap.add_argument("--full", action="store_true", help="Re-export every month (default: the latest months plus older months rescored since the last snapshot)")
+    p_week = sub.add_parser("weekly", help="Weekly mean sentiment")
+    p_week.add_argument("--by-channel", action="store_true")
+    p_cat = sub.add_parser("categories", help="Weekly category sentiment y and weight n")
+    p_cat.add_argument("--cat-threshold", type=float, default=0.25)
+    p_cat.add_argument("--exclude", default="", help="Comma-separated categories to drop")
+    p_sweep = sub.add_parser("sweep", help="Coverage and gaps for several cat_threshold values")
+    p_sweep.add_argument("--thresholds", default="0.1,0.15,0.2,0.25,0.3,0.4,0.5")
+    p_heat = sub.add_parser("heatmap", help="Weeks x categories mean score")
+    p_heat.add_argument("--cat-threshold", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.cmd == "snapshot":
+        conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+        n = snapshot(conn, args.path, since=args.since, full=args.full)
+        conn.close()
+        logger.info(f"Wrote {n} rows to {args.path}")
+    else:
+        con = connect(args.path)
+        if args.cmd == "weekly":
+            result = weekly_means(con, by_channel=args.by_channel)
+        elif args.cmd == "categories":
+            result = category_sentiment(con, args.cat_threshold, [c for c in args.exclude.split(",") if c])
+        elif args.cmd == "sweep":
+            result = threshold_sweep(con, [float(t) for t in args.thresholds.split(",")])
+        else:
+            result = category_heatmap(con, args.cat_threshold)
+        if args.csv:
+            result.to_csv(args.csv)
+        else:
+            with pd.option_context("display.max_rows", 200, "display.width", 200):
+                print(result)
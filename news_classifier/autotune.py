@@ -0,0 +1,311 @@
+"""
+Batch size / token budget / torch thread autotuner for the scoring models.
+
+Runs short probes on a sample of messages (the latest rows from `messages`,
+or synthetic texts with --synthetic). For each probe it measures messages/s
+and peak RSS. The search is coordinate-wise: first threads, then batch size,
+then max_length. The best configuration goes into a JSON profile file keyed by
+a host/model fingerprint (CPU model, core count, GPU, torch version, model).
+sentiment.main and tag.main read the matching profile at startup
+(apply_profile). Without a profile they keep the built-in defaults.
+
+max_length candidates shorter than the 95th percentile of the sample's token
+lengths are skipped, since they would truncate typical messages and change
+the scores.
+
+Usage:
+  python -m news_classifier.autotune --model finbert
+  python -m news_classifier.autotune --model all --threads 8,16,32 --max-rss-mb 6000
+"""
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import platform
+import resource
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILES_ENV = "NEWS_CLASSIFIER_PROFILES"
+DEFAULT_PROFILES = os.path.expanduser("~/.config/news_classifier/profiles.json")
+
+# Built-in defaults, used when no profile matches this host
+MODELS = {
+    "finbert": {"batch_size": 64, "max_length": 128, "batch_sizes": [16, 32, 64, 128, 256], "max_lengths": [64, 128, 256]},
+    "bart-large-mnli": {"batch_size": 8, "max_length": None, "batch_sizes": [2, 4, 8, 16, 32], "max_lengths": [256, 512]},
+}
+
+
+def profiles_path() -> str:
+    return os.environ.get(PROFILES_ENV, DEFAULT_PROFILES)
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def fingerprint(model_key: str) -> str:
+    """
+    Stable id for (host hardware, torch build, model). Hosts with the same
+    hardware share profiles; a torch upgrade or a GPU change does not.
+    """
+    import torch
+    gpu = torch.cuda.get_device_name(0) if torch.cuda.is_available() else "cpu"
+    key = f"{model_key}|{_cpu_model()}|{os.cpu_count()}|{gpu}|{torch.__version__}"
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def load_profiles(path: Optional[str] = None) -> Dict[str, dict]:
+    path = path or profiles_path()
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable profile file {path}: {e}")
+        return {}
+
+
+def save_profile(model_key: str, profile: dict, path: Optional[str] = None) -> str:
+    path = path or profiles_path()
+    profiles = load_profiles(path)
+    profiles[fingerprint(model_key)] = profile
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(profiles, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+    return path
+
+
+def apply_profile(model_key: str) -> Dict[str, Optional[int]]:
+    """
+    Look up this host's profile for `model_key`, set torch's thread count from
+    it, and return {'batch_size', 'max_length'} to use (built-in defaults when
+    there is no profile).
+    """
+    defaults = MODELS[model_key]
+    profile = load_profiles().get(fingerprint(model_key))
+    if profile is None:
+        return {"batch_size": defaults["batch_size"], "max_length": defaults["max_length"]}
+    if profile.get("num_threads"):
+        import torch
+        torch.set_num_threads(int(profile["num_threads"]))
+    logger.info(
+        f"Using tuned profile for {model_key}: batch_size={profile['batch_size']} "
+        f"max_length={profile['max_length']} threads={profile.get('num_threads')} "
+        f"({profile.get('msg_per_s', 0):.1f} msg/s when tuned)"
+    )
+    return {"batch_size": profile["batch_size"], "max_length": profile["max_length"]}
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in KiB on Linux and already a peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSS:
+    """
+    Samples the process RSS on a background thread; .peak holds the maximum.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+        return False
+
+
+def sample_texts(n: int, synthetic: bool = False, dsn: Optional[str] = None) -> List[str]:
+    if not synthetic:
+        import psycopg2
+        try:
+            conn = psycopg2.connect(dsn or "postgresql://ian@localhost:5432/telegram_news")
+            cur = conn.cursor()
+            cur.execute("SELECT text FROM messages WHERE text IS NOT NULL ORDER BY date_unix DESC LIMIT %s", (n,))
+            texts = [r[0] for r in cur.fetchall()]
+            conn.close()
+            if texts:
+                return texts
+        except Exception as e:
+            logger.warning(f"Could not sample messages ({e}); using synthetic texts")
+    from news_classifier.telegram_news.fake_client import SyntheticChannel
+    channel = SyntheticChannel("autotune", n, dup_prob=0.0, junk_prob=0.0)
+    return [channel.text(i) for i in range(1, n + 1)]
+
+
+class Scorer:
+    """
+    Loads one model once and runs timed probes with a given configuration.
+    """
+
+    def __init__(self, model_key: str):
+        self.model_key = model_key
+        if model_key == "finbert":
+            import news_classifier.sentiment.finbert as mod
+            self.tokenizer, self.model = mod.load_model()
+        else:
+            import news_classifier.tag.bart_large_mnli as mod
+            from news_classifier.tag.labels import LABELS
+            self.labels = LABELS
+            self.tokenizer, self.model = mod.load_model()
+        if self.model is None:
+            raise RuntimeError(f"Could not load {model_key}")
+        self.mod = mod
+        self.device = mod.get_device()
+
+    def token_length_p95(self, texts: List[str]) -> int:
+        lengths = sorted(len(ids) for ids in self.tokenizer(texts, truncation=False)["input_ids"])
+        return lengths[int(0.95 * (len(lengths) - 1))]
+
+    def run(self, texts: List[str], batch_size: int, max_length: Optional[int]) -> None:
+        if self.model_key == "finbert":
+            self.mod.predict_proba_array(
+                texts, self.tokenizer, self.model, device=self.device,
+                batch_size=batch_size, max_length=max_length, pipelined=True,
+            )
+        else:
+            self.mod.zero_shot_scores(
+                texts, self.labels, tokenizer=self.tokenizer, model=self.model, device=self.device,
+                batch_size=batch_size, max_length=max_length, amp_dtype="bf16", pipelined=True,
+            )
+
+    def probe(self, texts: List[str], batch_size: int, max_length: Optional[int], num_threads: int) -> dict:
+        import torch
+        torch.set_num_threads(num_threads)
+        # Warm-up batch: allocator growth and lazy kernels should not count
+        self.run(texts[:batch_size], batch_size, max_length)
+        with PeakRSS() as rss:
+            start = time.perf_counter()
+            self.run(texts, batch_size, max_length)
+            elapsed = time.perf_counter() - start
+        result = {
+            "batch_size": batch_size,
+            "max_length": max_length,
+            "num_threads": num_threads,
+            "msg_per_s": len(texts) / elapsed,
+            "peak_rss_mb": rss.peak / 2**20,
+        }
+        logger.info(
+            f"{self.model_key} bs={batch_size} max_length={max_length} threads={num_threads}: "
+            f"{result['msg_per_s']:.1f} msg/s, peak RSS {result['peak_rss_mb']:.0f} MB"
+        )
+        return result
+
+
+def _best(results: List[dict], max_rss_mb: Optional[float]) -> Optional[dict]:
+    ok = [r for r in results if max_rss_mb is None or r["peak_rss_mb"] <= max_rss_mb]
+    return max(ok, key=lambda r: r["msg_per_s"]) if ok else None
+
+
+def tune(
+    model_key: str,
+    texts: List[str],
+    batch_sizes: List[int],
+    max_lengths: List[Optional[int]],
+    threads: List[int],
+    max_rss_mb: Optional[float] = None,
+) -> dict:
+    scorer = Scorer(model_key)
+    defaults = MODELS[model_key]
+    p95 = scorer.token_length_p95(texts)
+    lengths = [m for m in max_lengths if m is None or m >= p95] or [max(m for m in max_lengths if m is not None)]
+    logger.info(f"{model_key}: p95 token length {p95}, max_length candidates {lengths}")
+
+    best = {"batch_size": defaults["batch_size"], "max_length": defaults["max_length"], "num_threads": threads[-1]}
+    if best["max_length"] not in lengths:
+        best["max_length"] = lengths[0]
+    results: List[dict] = []
+    for knob, values in (("num_threads", threads), ("batch_size", batch_sizes), ("max_length", lengths)):
+        round_results = []
+        for v in values:
+            cfg = {**best, knob: v}
+            round_results.append(scorer.probe(texts, cfg["batch_size"], cfg["max_length"], cfg["num_threads"]))
+        results += round_results
+        winner = _best(round_results, max_rss_mb)
+        if winner is not None:
+            best = {k: winner[k] for k in ("batch_size", "max_length", "num_threads")}
+    final = _best([r for r in results if all(r[k] == best[k] for k in best)], None) or results[-1]
+    return {
+        **final,
+        "model": model_key,
+        "host": platform.node(),
+        "cpu": _cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "probe_messages": len(texts),
+        "tuned_at": int(time.time()),
+    }
+
+
+def _ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main() -> None:
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", choices=["finbert", "bart-large-mnli", "all"], default="all")
+    parser.add_argument("--messages", type=int, default=None, help="Probe size (default: 512 for finbert, 64 for BART)")
+    parser.add_argument("--batch-sizes", default=None, help="Comma-separated candidates")
+    parser.add_argument("--max-lengths", default=None, help="Comma-separated token budgets")
+    parser.add_argument("--threads", default=None, help="Comma-separated torch thread counts (default: powers of 2 up to the core count)")
+    parser.add_argument("--max-rss-mb", type=float, default=None, help="Reject configurations above this peak RSS")
+    parser.add_argument("--synthetic", action="store_true", help="Probe with synthetic texts instead of the messages table")
+    parser.add_argument("--profiles", default=None, help=f"Profile file (default: ${PROFILES_ENV} or {DEFAULT_PROFILES})")
+    parser.add_argument("--dry-run", action="store_true", help="Print the best configuration without saving it")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    threads = _ints(args.threads) if args.threads else sorted({min(2**i, cores) for i in range(cores.bit_length() + 1)})
+    keys = list(MODELS) if args.model == "all" else [args.model]
+    for key in keys:
+        n = args.messages or (512 if key == "finbert" else 64)
+        texts = sample_texts(n, synthetic=args.synthetic)
+        profile = tune(
+            key,
+            texts,
+            _ints(args.batch_sizes) if args.batch_sizes else MODELS[key]["batch_sizes"],
+            _ints(args.max_lengths) if args.max_lengths else MODELS[key]["max_lengths"],
+            threads,
+            max_rss_mb=args.max_rss_mb,
+        )
+        print(json.dumps(profile, indent=2))
+        if not args.dry_run:
+            path = save_profile(key, profile, args.profiles)
+            logger.info(f"Saved {key} profile {fingerprint(key)} to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
 from psycopg2.extensions import connection as PGConnection
 import psycopg2
+from psycopg2 import sql
 import pandas as pd
+from news_classifier.tag.database import get_labels
 
 def create_dataset(conn: PGConnection, min_unix_time):
-    query = """
+    # Tag columns follow the label registry (one column per registered label)
+    tag_cols = sql.SQL(", ").join(
+        sql.SQL("t.") + sql.Identifier(c) for c in get_labels(conn)["column_name"]
+    )
+    query = sql.SQL("""
     SELECT m.channel, m.id, m.date_unix, 
     s.positive, s.neutral, s.negative, 
-    t.macroeconomics_and_central_banks, t.geopolitics_war_and_international_security, t.domestic_politics_and_government_policy, t.financial_markets_assets_and_trading, t.technology_and_corporate_innovation, t.social_issues_protests_and_public_health, t.crypto_and_blockchain, t.entertainment_sports_and_lifestyle FROM (
+    {tag_cols} FROM (
         SELECT * FROM messages WHERE date_unix >= %s
     ) m 
-    LEFT JOIN message_sentiment s ON m.channel = s.channel AND m.id = s.id
-    LEFT JOIN message_tag t ON m.channel = t.channel AND m.id = t.id;
-    """
+    LEFT JOIN message_sentiment s ON m.channel = s.channel AND m.id = s.id AND m.date_unix = s.date_unix
+    LEFT JOIN message_tag t ON m.channel = t.channel AND m.id = t.id AND m.date_unix = t.date_unix;
+    """).format(tag_cols=tag_cols)
     cursor = conn.cursor()
     cursor.execute(query, (min_unix_time,))
     rows = cursor.fetchall()
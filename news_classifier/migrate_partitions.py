@@ -0,0 +1,205 @@
+"""
+Online migration of messages / message_sentiment from single heaps to
+monthly range partitions on date_unix. A wide message_tag table is then
+converted to the per-label message_tag_score store (tag.database.migrate_wide_tags).
+
+1. Create partitioned shadow tables (<table>_new) whose partitions already
+   carry their final names (<table>_yYYYYmMM).
+2. Copy the data month by month, one short transaction per month, so
+   ingestion and scoring keep running. Score rows get date_unix from their
+   message.
+3. Cutover in one transaction: lock the old tables against writes, compare
+   per-month row counts and recopy any month that changed, drop the FKs the
+   near-duplicate tables had on messages, then swap names. The old heaps are
+   kept as <table>_heap unless --drop-old is given.
+
+The old code keeps writing to the heaps while this runs; deploy the
+partition-aware writers only after the cutover. Score upserts that overwrite
+existing rows during step 2 are not picked up by the count check, so pause
+the scorers while migrating.
+
+Usage:
+  python -m news_classifier.migrate_partitions [--drop-old]
+"""
+from typing import Dict, List, Tuple
+import logging
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import connection as PGConnection
+
+from news_classifier.partitions import add_months, ensure_partition, month_bounds, month_of
+from news_classifier.sentiment.database import ensure_sentiment_table
+from news_classifier.tag.database import migrate_wide_tags
+from news_classifier.tag.labels import LABELS
+from news_classifier.telegram_news.database import ensure_messages_table
+
+logger = logging.getLogger(__name__)
+
+# Tags move to the long store instead (see migrate_wide_tags)
+_TABLES = ["messages", "message_sentiment"]
+
+_MONTH_EXPR = "date_trunc('month', to_timestamp({col}) AT TIME ZONE 'UTC')"
+
+
+def is_partitioned(conn: PGConnection, table: str) -> bool:
+    cur = conn.cursor()
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'p')", (table,))
+    row = cur.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def _columns(conn: PGConnection, table: str) -> List[str]:
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = %s ORDER BY ordinal_position",
+        (table,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def _months(conn: PGConnection) -> List[Tuple[int, int]]:
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(date_unix), MAX(date_unix) FROM messages")
+    lo, hi = cur.fetchone()
+    if lo is None:
+        return []
+    (y, m), last = month_of(lo), month_of(hi)
+    out = []
+    while (y, m) <= last:
+        out.append((y, m))
+        y, m = add_months(y, m, 1)
+    return out
+
+
+def _copy_month(conn: PGConnection, year: int, month: int, commit: bool = True) -> Dict[str, int]:
+    """
+    Copy one month of messages and sentiment into the shadow tables (idempotent).
+    """
+    start, end = month_bounds(year, month)
+    for table in _TABLES:
+        ensure_partition(conn, table, year, month, parent=f"{table}_new")
+    cur = conn.cursor()
+    copied = {}
+    cur.execute(
+        """
+        INSERT INTO messages_new (channel, id, date_unix, sender_id, sender, views, forwards, replies, text)
+        SELECT channel, id, date_unix, sender_id, sender, views, forwards, replies, text
+        FROM messages WHERE date_unix >= %s AND date_unix < %s
+        ON CONFLICT DO NOTHING
+        """,
+        (start, end),
+    )
+    copied["messages"] = cur.rowcount
+    cur.execute(
+        """
+        INSERT INTO message_sentiment_new (channel, id, date_unix, positive, neutral, negative, created_at)
+        SELECT s.channel, s.id, m.date_unix, s.positive, s.neutral, s.negative, s.created_at
+        FROM message_sentiment s
+        JOIN messages m ON m.channel = s.channel AND m.id = s.id
+        WHERE m.date_unix >= %s AND m.date_unix < %s
+        ON CONFLICT DO NOTHING
+        """,
+        (start, end),
+    )
+    copied["message_sentiment"] = cur.rowcount
+    if commit:
+        conn.commit()
+    return copied
+
+
+def _month_counts(conn: PGConnection, table: str, date_source: str) -> Dict[str, int]:
+    """
+    Row count per month. `date_source` is the table holding date_unix:
+    the table itself, or 'messages' for old score tables without date_unix.
+    """
+    cur = conn.cursor()
+    month = sql.SQL(_MONTH_EXPR.format(col="d.date_unix"))
+    if date_source == table:
+        q = sql.SQL("SELECT {month}, COUNT(*) FROM {t} d GROUP BY 1").format(month=month, t=sql.Identifier(table))
+    else:
+        q = sql.SQL(
+            "SELECT {month}, COUNT(*) FROM {t} s JOIN {src} d ON d.channel = s.channel AND d.id = s.id GROUP BY 1"
+        ).format(month=month, t=sql.Identifier(table), src=sql.Identifier(date_source))
+    cur.execute(q)
+    return {str(k): int(v) for k, v in cur.fetchall()}
+
+
+def _changed_months(conn: PGConnection, tables: List[str]) -> List[Tuple[int, int]]:
+    changed = set()
+    for table in tables:
+        old = _month_counts(conn, table, "messages")
+        new = _month_counts(conn, f"{table}_new", f"{table}_new")
+        for key in set(old) | set(new):
+            if old.get(key) != new.get(key) and key != "None":
+                changed.add((int(key[:4]), int(key[5:7])))
+    return sorted(changed)
+
+
+def migrate(conn: PGConnection, drop_old: bool = False) -> None:
+    if is_partitioned(conn, "messages"):
+        logger.info("messages is already partitioned")
+    else:
+        _migrate_partitions(conn, drop_old)
+
+    n = migrate_wide_tags(conn, LABELS)
+    logger.info(f"Moved {n} tag scores to message_tag_score")
+
+
+def _migrate_partitions(conn: PGConnection, drop_old: bool) -> None:
+
+    ensure_messages_table(conn, table="messages_new")
+    ensure_sentiment_table(conn, table="message_sentiment_new", messages_table="messages_new")
+    tables = list(_TABLES)
+
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM messages WHERE date_unix IS NULL")
+    n_null = cur.fetchone()[0]
+    if n_null:
+        logger.warning(f"{n_null} messages without date_unix cannot be partitioned and are left behind")
+
+    # 1) bulk copy, one transaction per month
+    for year, month in _months(conn):
+        copied = _copy_month(conn, year, month)
+        logger.info(f"{year}-{month:02d}: {copied}")
+
+    # 2) cutover
+    cur.execute("LOCK TABLE messages, message_sentiment IN EXCLUSIVE MODE")
+    for year, month in _changed_months(conn, tables):
+        copied = _copy_month(conn, year, month, commit=False)
+        logger.info(f"catch-up {year}-{month:02d}: {copied}")
+    remaining = _changed_months(conn, tables)
+    if remaining:
+        conn.rollback()
+        raise RuntimeError(f"Row counts still differ after catch-up for months {remaining}; re-run the migration")
+
+    # The wide message_tag table is left on the old heap until migrate_wide_tags replaces it
+    for child in ("message_minhash", "message_lsh_bucket", "message_tag"):
+        cur.execute(sql.SQL("ALTER TABLE IF EXISTS {} DROP CONSTRAINT IF EXISTS {}").format(
+            sql.Identifier(child), sql.Identifier(f"{child}_channel_id_fkey")
+        ))
+    for table in reversed(_TABLES):
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            sql.Identifier(table), sql.Identifier(f"{table}_heap")
+        ))
+        cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+            sql.Identifier(f"{table}_new"), sql.Identifier(table)
+        ))
+    cur.execute("ALTER INDEX IF EXISTS idx_messages_date RENAME TO idx_messages_heap_date")
+    cur.execute("ALTER INDEX idx_messages_new_date RENAME TO idx_messages_date")
+    if drop_old:
+        for table in reversed(_TABLES):
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(f"{table}_heap")))
+    conn.commit()
+    logger.info("Cutover done: messages and message_sentiment are partitioned by month")
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drop-old", action="store_true", help="Drop the old heap tables after cutover")
+    args = parser.parse_args()
+    conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+    migrate(conn, drop_old=args.drop_old)
+    conn.close()
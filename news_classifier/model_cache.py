@@ -0,0 +1,91 @@
+"""
+Model loading shared by the FinBERT and BART-MNLI wrappers.
+
+Weights are memory-mapped instead of copied into process memory, so several
+worker processes on one host share the same page-cache pages:
+
+  - without a cache, from_pretrained(low_cpu_mem_usage=True) reads the
+    checkpoint's model.safetensors through mmap and skips the random init;
+  - with a cache directory (NEWS_CLASSIFIER_MODEL_CACHE or cache_dir=...), the
+    first load serialises the ready-to-use model there and later loads
+    torch.load(..., mmap=True) it: no config/checkpoint parsing, no weight
+    copy, the tensors stay backed by the cache file.
+
+The cache holds a pickled nn.Module, so only point it at a directory you own.
+Entries are keyed by the checkpoint (a local directory and its mtime, or a hub
+id and the commit hash of its cached snapshot) and the torch/transformers
+versions, so an upgrade or a new checkpoint writes a new entry.
+"""
+from typing import Optional, Tuple
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENV = "NEWS_CLASSIFIER_MODEL_CACHE"
+
+
+def _hub_revision(repo_id: str) -> Optional[str]:
+    """
+    Commit hash of the snapshot huggingface_hub resolves for repo_id, or None
+    when nothing is cached. from_pretrained refreshes refs/main when online.
+    """
+    from huggingface_hub import try_to_load_from_cache
+    path = try_to_load_from_cache(repo_id, "config.json")
+    if not isinstance(path, str):
+        return None
+    return os.path.basename(os.path.dirname(path))
+
+
+def cache_path(model_name_or_path: str, cache_dir: str) -> Optional[str]:
+    """
+    Cache file for a checkpoint, or None when its version cannot be resolved
+    (the model is then loaded without the cache rather than from a stale entry).
+    """
+    import torch
+    import transformers
+    if os.path.isdir(model_name_or_path):
+        source = os.path.abspath(model_name_or_path)
+        stamp = max((os.path.getmtime(os.path.join(source, f)) for f in os.listdir(source)), default=0)
+    else:
+        source, stamp = model_name_or_path, _hub_revision(model_name_or_path)
+        if stamp is None:
+            return None
+    key = f"{source}|{stamp}|{torch.__version__}|{transformers.__version__}"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    name = os.path.basename(model_name_or_path.rstrip("/")) or "model"
+    return os.path.join(cache_dir, f"{name}-{digest}.pt")
+
+
+def load_sequence_classifier(model_name_or_path: str, cache_dir: Optional[str] = None) -> Tuple[object, object]:
+    """
+    Returns (tokenizer, model) for an AutoModelForSequenceClassification checkpoint.
+    """
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    # Loading the tokenizer first also updates the hub snapshot cache_path keys on
+    tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+    cache_dir = cache_dir or os.environ.get(CACHE_ENV)
+    path = cache_path(model_name_or_path, cache_dir) if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            model = torch.load(path, mmap=True, weights_only=False, map_location="cpu")
+            model.eval()
+            return tokenizer, model
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable model cache {path}: {e}")
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_name_or_path, low_cpu_mem_usage=True)
+    model.eval()
+    if path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        torch.save(model, tmp)
+        os.replace(tmp, path)
+        logger.info(f"Wrote model cache {path}")
+        # Reload through mmap so this process shares pages with later workers too
+        model = torch.load(path, mmap=True, weights_only=False, map_location="cpu")
+        model.eval()
+    return tokenizer, model
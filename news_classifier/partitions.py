@@ -0,0 +1,179 @@
+"""
+Monthly range partitions on date_unix (UTC) for messages and score tables.
+
+Partitions are named <table>_yYYYYmMM and cover [first second of the month,
+first second of the next month). They are created on demand by the writers
+(ensure_partitions_for) and can be pre-created / detached from the CLI:
+
+  python -m news_classifier.partitions precreate --months 3
+  python -m news_classifier.partitions detach --before 2024-01 [--drop]
+"""
+from datetime import datetime, timezone
+from typing import Iterable, List, Tuple
+import logging
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import connection as PGConnection
+
+logger = logging.getLogger(__name__)
+
+# Parents first: detaching/dropping goes in reverse order
+PARTITIONED_TABLES = ["messages", "message_sentiment", "message_tag_score"]
+
+
+def month_of(ts: int) -> Tuple[int, int]:
+    d = datetime.fromtimestamp(int(ts), tz=timezone.utc)
+    return d.year, d.month
+
+
+def add_months(year: int, month: int, n: int) -> Tuple[int, int]:
+    idx = year * 12 + (month - 1) + n
+    return idx // 12, idx % 12 + 1
+
+
+def month_bounds(year: int, month: int) -> Tuple[int, int]:
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    ny, nm = add_months(year, month, 1)
+    end = datetime(ny, nm, 1, tzinfo=timezone.utc)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def partition_name(table: str, year: int, month: int) -> str:
+    return f"{table}_y{year:04d}m{month:02d}"
+
+
+def ensure_partition(conn: PGConnection, table: str, year: int, month: int, parent: str | None = None) -> str:
+    """
+    Create the month partition of `table` if missing (does not commit).
+    `parent` attaches it to a differently named parent (used while migrating).
+    """
+    name = partition_name(table, year, month)
+    cur = conn.cursor()
+    # Check first: CREATE ... PARTITION OF locks the parent even when it is a no-op
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    if cur.fetchone()[0] is not None:
+        return name
+    start, end = month_bounds(year, month)
+    cur.execute(
+        sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)").format(
+            sql.Identifier(name), sql.Identifier(parent or table)
+        ),
+        (start, end),
+    )
+    return name
+
+
+def ensure_partitions_for(conn: PGConnection, table: str, timestamps: Iterable[int]) -> None:
+    """
+    Make sure every month touched by `timestamps` has a partition (does not commit).
+    """
+    for year, month in sorted({month_of(ts) for ts in timestamps if ts is not None}):
+        ensure_partition(conn, table, year, month)
+
+
+def precreate_partitions(conn: PGConnection, months_ahead: int = 3, tables: List[str] = PARTITIONED_TABLES) -> List[str]:
+    """
+    Create partitions for the current month and the next `months_ahead` months.
+    """
+    now = datetime.now(timezone.utc)
+    names = []
+    for i in range(months_ahead + 1):
+        year, month = add_months(now.year, now.month, i)
+        for table in tables:
+            names.append(ensure_partition(conn, table, year, month))
+    conn.commit()
+    return names
+
+
+def list_partitions(conn: PGConnection, table: str) -> List[str]:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        ORDER BY c.relname
+        """,
+        (table,),
+    )
+    return [r[0] for r in cur.fetchall()]
+
+
+def _drop_dedup_rows(cur, partition: str) -> None:
+    # The near-duplicate index has no FK to the partitioned messages table
+    for dedup_table in ("message_lsh_bucket", "message_minhash"):
+        cur.execute("SELECT to_regclass(%s)", (dedup_table,))
+        if cur.fetchone()[0] is None:
+            continue
+        cur.execute(sql.SQL("DELETE FROM {} d USING {} m WHERE d.channel = m.channel AND d.id = m.id").format(
+            sql.Identifier(dedup_table), sql.Identifier(partition)
+        ))
+
+
+def _drop_message_fks(cur, partition: str) -> None:
+    # A detached score partition keeps its FK to messages as a standalone
+    # constraint, which would block detaching the matching messages partition
+    cur.execute(
+        """
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype = 'f' AND confrelid = 'messages'::regclass
+        """,
+        (partition,),
+    )
+    for (conname,) in cur.fetchall():
+        cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+            sql.Identifier(partition), sql.Identifier(conname)
+        ))
+
+
+def detach_before(conn: PGConnection, year: int, month: int, drop: bool = False) -> List[str]:
+    """
+    Detach (and optionally drop) every partition older than year-month.
+    Score tables go first since they reference messages; detached score
+    partitions lose their foreign key to messages.
+    """
+    cutoff = partition_name("", year, month)
+    detached = []
+    cur = conn.cursor()
+    for table in reversed(PARTITIONED_TABLES):
+        for name in list_partitions(conn, table):
+            if name[len(table):] >= cutoff:
+                continue
+            if table == "messages":
+                _drop_dedup_rows(cur, name)
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(table), sql.Identifier(name)
+            ))
+            if drop:
+                cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            elif table != "messages":
+                _drop_message_fks(cur, name)
+            detached.append(name)
+    conn.commit()
+    return detached
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_pre = sub.add_parser("precreate", help="Create partitions for upcoming months")
+    p_pre.add_argument("--months", type=int, default=3)
+    p_det = sub.add_parser("detach", help="Detach partitions older than a month")
+    p_det.add_argument("--before", required=True, help="YYYY-MM")
+    p_det.add_argument("--drop", action="store_true", help="Drop detached partitions")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+    if args.cmd == "precreate":
+        names = precreate_partitions(conn, args.months)
+        logger.info(f"Ensured {len(names)} partitions")
+    else:
+        year, month = (int(x) for x in args.before.split("-"))
+        names = detach_before(conn, year, month, drop=args.drop)
+        logger.info(f"{'Dropped' if args.drop else 'Detached'} {len(names)} partitions: {names}")
+    conn.close()
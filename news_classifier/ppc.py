@@ -0,0 +1,321 @@
+"""
+Posterior predictive checks and residual diagnostics for the state-space model,
+vectorised over all categories and every posterior draw.
+
+Python counterpart of extract_draws_r2jags / ppc_category / ppc_all_r2jags and
+the standardized-residual chunk of bayesian_sentiment_script.Rmd:
+
+  - posterior:   y_rep ~ N(x[s], sigma[s] / sqrt(n)) per draw s
+  - conditional: x fixed at its posterior median, only observation noise varies
+  - forward:     x simulated from the state equation with theta, mu, sigma.eta
+                 x[1] ~ N(mu, sigma.eta), x[t] ~ N((1 - theta) mu + theta x[t-1], sigma.eta)
+
+Draws are read from a directory written by the R export snippet in the README:
+raw float64 files in R's column-major order (x_draws.f64 of shape (S, N, M),
+sigma_draws.f64 / theta_draws.f64 / mu_draws.f64 / sigma_eta_draws.f64 of
+shape (S, M), y.f64 and n.f64 of shape (N, M)) plus meta.json with S, N, M and
+the category names. Plain .npy files with the same names work as well.
+Both are memory-mapped, draws are processed in chunks on a thread pool, and
+the replicates y_rep go to a temporary memory-mapped file (in the system temp
+directory unless --scratch-dir is given; --in-memory keeps them in RAM), so
+the full posterior fits even when it is larger than RAM.
+
+Usage:
+  python -m news_classifier.ppc --draws-dir draws --type posterior --out-dir tables
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PPC_TYPES = ("posterior", "conditional", "forward")
+
+
+def _load_array(draws_dir: str, name: str, shape: Tuple[int, ...]) -> Optional[np.ndarray]:
+    npy = os.path.join(draws_dir, f"{name}.npy")
+    raw = os.path.join(draws_dir, f"{name}.f64")
+    if os.path.exists(npy):
+        arr = np.load(npy, mmap_mode="r")
+    elif os.path.exists(raw):
+        # R writes arrays column-major
+        arr = np.memmap(raw, dtype=np.float64, mode="r", shape=shape, order="F")
+    else:
+        return None
+    if arr.shape != shape:
+        raise ValueError(f"{name}: expected shape {shape}, got {arr.shape}")
+    return arr
+
+
+def load_draws(draws_dir: str) -> Dict[str, object]:
+    """
+    Memory-map an exported posterior: keys x, sigma, theta, mu, sigma_eta
+    (None when not monitored), y, n and categories.
+    """
+    with open(os.path.join(draws_dir, "meta.json")) as f:
+        meta = json.load(f)
+    S, N, M = int(meta["S"]), int(meta["N"]), int(meta["M"])
+    draws = {
+        "x": _load_array(draws_dir, "x_draws", (S, N, M)),
+        "sigma": _load_array(draws_dir, "sigma_draws", (S, M)),
+        "theta": _load_array(draws_dir, "theta_draws", (S, M)),
+        "mu": _load_array(draws_dir, "mu_draws", (S, M)),
+        "sigma_eta": _load_array(draws_dir, "sigma_eta_draws", (S, M)),
+        "y": _load_array(draws_dir, "y", (N, M)),
+        "n": _load_array(draws_dir, "n", (N, M)),
+        "categories": meta.get("categories") or [f"cat_{j + 1}" for j in range(M)],
+    }
+    for key in ("x", "sigma", "y", "n"):
+        if draws[key] is None:
+            raise ValueError(f"{draws_dir} has no {key} draws")
+    return draws
+
+
+def _chunks(idx: np.ndarray, chunk_size: int) -> List[np.ndarray]:
+    return [idx[i : i + chunk_size] for i in range(0, len(idx), chunk_size)]
+
+
+def _median_over_draws(x: np.ndarray, chunk_size: int) -> np.ndarray:
+    # Median over axis 0 one time block at a time, so only a (S, block, M) slice is in memory
+    S, N, M = x.shape
+    block = max(1, chunk_size * 64 // max(S, 1))
+    return np.concatenate([np.median(np.asarray(x[:, t : t + block]), axis=0) for t in range(0, N, block)])
+
+
+def _simulate_chunk(
+    draws: Dict[str, object],
+    sims: np.ndarray,
+    ppc_type: str,
+    obs_sd_scale: np.ndarray,
+    x_hat: Optional[np.ndarray],
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    y_rep for draws `sims`: array (len(sims), N, M).
+    """
+    sigma = np.asarray(draws["sigma"][sims])[:, None, :]  # (s, 1, M)
+    if ppc_type == "posterior":
+        mean = np.asarray(draws["x"][sims])
+    elif ppc_type == "conditional":
+        mean = np.broadcast_to(x_hat, (len(sims), *x_hat.shape))
+    else:
+        theta = np.asarray(draws["theta"][sims])
+        mu = np.asarray(draws["mu"][sims])
+        sd_eta = np.asarray(draws["sigma_eta"][sims])
+        N = obs_sd_scale.shape[0]
+        mean = np.empty((len(sims), N, mu.shape[1]))
+        mean[:, 0] = rng.normal(mu, sd_eta)
+        for t in range(1, N):
+            mean[:, t] = rng.normal((1 - theta) * mu + theta * mean[:, t - 1], sd_eta)
+    return mean + sigma * obs_sd_scale[None] * rng.standard_normal(mean.shape)
+
+
+def _replicate_stats(
+    draws: Dict[str, object],
+    chunks: List[np.ndarray],
+    rngs: List[np.random.Generator],
+    yrep: np.ndarray,
+    ppc_type: str,
+    obs_sd_scale: np.ndarray,
+    x_hat: Optional[np.ndarray],
+    valid: np.ndarray,
+    y: np.ndarray,
+    levels: Tuple[float, float],
+    chunk_size: int,
+    workers: Optional[int],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fill `yrep` chunk by chunk and return (out-of-range counts (N, M),
+    counts of replicate means >= observed mean (M), quantile bands (5, N, M)).
+    """
+    N = y.shape[0]
+    n_valid = valid.sum(axis=0)
+    obs_mean = np.where(valid, y, 0).sum(axis=0) / n_valid
+    offsets = np.concatenate([[0], np.cumsum([len(c) for c in chunks])])
+
+    def run(k: int) -> Tuple[np.ndarray, np.ndarray]:
+        rep = _simulate_chunk(draws, chunks[k], ppc_type, obs_sd_scale, x_hat, rngs[k])
+        yrep[offsets[k] : offsets[k + 1]] = rep
+        out = ((rep < -1) | (rep > 1)) & valid
+        rep_mean = np.where(valid, rep, 0).sum(axis=1) / n_valid  # (s, M)
+        return out.sum(axis=0), (rep_mean >= obs_mean).sum(axis=0)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        parts = list(pool.map(run, range(len(chunks))))
+    out_count = sum(p[0] for p in parts)
+    ge_count = sum(p[1] for p in parts)
+
+    q_lo1, q_lo2 = (1 - levels[0]) / 2, (1 - levels[1]) / 2
+    qs = [0.5, q_lo1, 1 - q_lo1, q_lo2, 1 - q_lo2]
+    block = max(1, chunk_size * 64 // max(len(yrep), 1))
+
+    def band(t0: int) -> np.ndarray:
+        return np.quantile(np.asarray(yrep[:, t0 : t0 + block]), qs, axis=0)  # (5, block, M)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        q = np.concatenate(list(pool.map(band, range(0, N, block))), axis=1)
+    return out_count, ge_count, q
+
+
+def ppc_all(
+    draws: Dict[str, object],
+    ppc_type: str = "posterior",
+    nsim: Optional[int] = None,
+    level1: float = 0.80,
+    level2: float = 0.95,
+    seed: int = 1,
+    eps: float = 1e-8,
+    chunk_size: int = 256,
+    workers: Optional[int] = None,
+    scratch_dir: Optional[str] = None,
+    in_memory: bool = False,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    PPC for every category at once. Uses all draws unless `nsim` is given.
+    Returns (summary, bands):
+      summary: category, cover80, cover95, p_mean, p_out_mean, p_out_max_t (as ppc_all_r2jags)
+      bands:   category, t (1-based), y, med, lo1, hi1, lo2, hi2 for observed (t, j)
+    y_rep is written to a temporary memory-mapped file in `scratch_dir`
+    (default: tempfile.gettempdir()), or kept in RAM with in_memory=True.
+    """
+    if ppc_type not in PPC_TYPES:
+        raise ValueError(f"type must be one of {PPC_TYPES}")
+    if ppc_type == "forward" and any(draws[k] is None for k in ("theta", "mu", "sigma_eta")):
+        raise ValueError("Forward PPC needs theta[j], mu[j], and sigma.eta[j] (or tau.eta[j]) monitored.")
+    y = np.asarray(draws["y"], dtype=np.float64)
+    n = np.asarray(draws["n"], dtype=np.float64)
+    S = draws["x"].shape[0]
+    N, M = y.shape
+    valid = ~np.isnan(y) & np.isfinite(n) & (n > 0)
+    if (valid.sum(axis=0) < 3).any():
+        bad = [draws["categories"][j] for j in np.flatnonzero(valid.sum(axis=0) < 3)]
+        raise ValueError(f"Too few observations for categories: {bad}")
+
+    root = np.random.SeedSequence(seed)
+    sims = np.arange(S)
+    if nsim is not None and nsim < S:
+        sims = np.sort(np.random.default_rng(root.spawn(1)[0]).choice(S, nsim, replace=False))
+    chunks = _chunks(sims, chunk_size)
+    rngs = [np.random.default_rng(s) for s in root.spawn(len(chunks) + 1)[1:]]
+
+    obs_sd_scale = 1.0 / np.sqrt(np.maximum(np.nan_to_num(n), eps))
+    x_hat = _median_over_draws(draws["x"], chunk_size) if ppc_type == "conditional" else None
+
+    shape = (len(sims), N, M)
+    if in_memory:
+        path, yrep = None, np.empty(shape)
+    else:
+        fd, path = tempfile.mkstemp(dir=scratch_dir or tempfile.gettempdir(), suffix=".npy")
+        os.close(fd)
+        yrep = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=shape)
+    try:
+        out_count, ge_count, q = _replicate_stats(
+            draws, chunks, rngs, yrep, ppc_type, obs_sd_scale, x_hat, valid, y,
+            (level1, level2), chunk_size, workers,
+        )
+    finally:
+        del yrep
+        if path is not None:
+            os.remove(path)
+    med, lo1, hi1, lo2, hi2 = q
+    n_valid = valid.sum(axis=0)
+
+    p_out_t = np.where(valid, out_count / len(sims), np.nan)
+    summary = pd.DataFrame({
+        "category": draws["categories"],
+        "cover80": np.nansum(valid & (y >= lo1) & (y <= hi1), axis=0) / n_valid,
+        "cover95": np.nansum(valid & (y >= lo2) & (y <= hi2), axis=0) / n_valid,
+        "p_mean": ge_count / len(sims),
+        "p_out_mean": out_count.sum(axis=0) / (n_valid * len(sims)),
+        "p_out_max_t": np.nanmax(p_out_t, axis=0),
+    })
+    t_idx, j_idx = np.nonzero(valid)
+    bands = pd.DataFrame({
+        "category": np.asarray(draws["categories"])[j_idx],
+        "t": t_idx + 1,
+        "y": y[t_idx, j_idx],
+        "med": med[t_idx, j_idx],
+        "lo1": lo1[t_idx, j_idx],
+        "hi1": hi1[t_idx, j_idx],
+        "lo2": lo2[t_idx, j_idx],
+        "hi2": hi2[t_idx, j_idx],
+    }).sort_values(["category", "t"], kind="stable").reset_index(drop=True)
+    return summary, bands
+
+
+def standardized_residuals(draws: Dict[str, object], chunk_size: int = 256) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    res = E[x | y] - y and sqrt(n) * res / mean(sigma_j), as in the Rmd.
+    Returns (residuals long: category, t, n, res, std_res; summary per category with
+    mean, sd, skewness, excess kurtosis and the Jarque-Bera p-value as a descriptive
+    normality check).
+    """
+    x = draws["x"]
+    S, N, M = x.shape
+    x_mean = sum(np.asarray(x[s : s + chunk_size]).sum(axis=0) for s in range(0, S, chunk_size)) / S
+    y = np.asarray(draws["y"], dtype=np.float64)
+    n = np.asarray(draws["n"], dtype=np.float64)
+    res = x_mean - y
+    std_res = np.sqrt(n) * res / np.asarray(draws["sigma"]).mean(axis=0)
+    ok = np.isfinite(std_res)
+
+    rows = []
+    for j, name in enumerate(draws["categories"]):
+        r = std_res[ok[:, j], j]
+        z = (r - r.mean()) / r.std()
+        skew, kurt = float((z ** 3).mean()), float((z ** 4).mean() - 3)
+        jb = len(r) / 6 * (skew ** 2 + kurt ** 2 / 4)
+        rows.append({
+            "category": name, "n_obs": len(r), "mean": r.mean(), "sd": r.std(ddof=1),
+            "skewness": skew, "excess_kurtosis": kurt, "jarque_bera_p": float(np.exp(-jb / 2)),
+        })
+    t_idx, j_idx = np.nonzero(ok)
+    residuals = pd.DataFrame({
+        "category": np.asarray(draws["categories"])[j_idx],
+        "t": t_idx + 1,
+        "n": n[t_idx, j_idx],
+        "res": res[t_idx, j_idx],
+        "std_res": std_res[t_idx, j_idx],
+    })
+    return residuals, pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--draws-dir", required=True)
+    parser.add_argument("--type", choices=PPC_TYPES, default="posterior")
+    parser.add_argument("--nsim", type=int, default=None, help="Subsample draws (default: all)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Draws per task")
+    parser.add_argument("--scratch-dir", default=None, help="Directory for the memory-mapped y_rep (default: system temp dir)")
+    parser.add_argument("--in-memory", action="store_true", help="Keep y_rep in RAM instead")
+    parser.add_argument("--out-dir", default="tables")
+    args = parser.parse_args()
+
+    draws = load_draws(args.draws_dir)
+    n_draws = draws["x"].shape[0]
+    start = time.perf_counter()
+    summary, bands = ppc_all(
+        draws, args.type, nsim=args.nsim, seed=args.seed, chunk_size=args.chunk_size,
+        workers=args.workers, scratch_dir=args.scratch_dir, in_memory=args.in_memory,
+    )
+    residuals, res_summary = standardized_residuals(draws, chunk_size=args.chunk_size)
+    logger.info(f"PPC ({args.type}) over {min(args.nsim or n_draws, n_draws)} draws took {time.perf_counter() - start:.2f}s")
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    summary.to_csv(os.path.join(args.out_dir, f"ppc_{args.type}_summary.csv"), index=False)
+    bands.to_csv(os.path.join(args.out_dir, f"ppc_{args.type}_bands.csv"), index=False)
+    residuals.to_csv(os.path.join(args.out_dir, "residuals.csv"), index=False)
+    res_summary.to_csv(os.path.join(args.out_dir, "residuals_summary.csv"), index=False)
+    print(summary.to_string(index=False))
+    print(res_summary.to_string(index=False))
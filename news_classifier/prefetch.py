@@ -0,0 +1,100 @@
+"""
+Three-stage producer/consumer loop used by the model wrappers:
+
+  tokenizer thread --(bounded queue)--> model (caller thread) --(queue)--> post-processing thread
+
+While batch k runs through the model, batch k+1 is tokenized and batch k-1 is
+copied back to the host, so the model never waits on the tokenizer. HF fast
+tokenizers and torch release the GIL, so plain threads are enough.
+"""
+from typing import Any, Callable, Iterable
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def run_pipelined(
+    batches: Iterable[Any],
+    prepare: Callable[[Any], Any],
+    infer: Callable[[Any], Any],
+    post: Callable[[Any], None],
+    prefetch: int = 2,
+) -> None:
+    """
+    For each item of `batches` run post(infer(prepare(item))), with prepare and
+    post on background threads. At most `prefetch` prepared batches wait for the
+    model. The first exception from any stage is re-raised here.
+    """
+    prepared: queue.Queue = queue.Queue(maxsize=max(1, prefetch))
+    finished: queue.Queue = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def _put(q: queue.Queue, item: Any) -> bool:
+        # Give up once another stage has failed so no thread hangs on a full queue
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(q: queue.Queue) -> Any:
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _producer() -> None:
+        try:
+            for item in batches:
+                if not _put(prepared, prepare(item)):
+                    return
+        except BaseException as e:
+            _put(prepared, _Failed(e))
+            return
+        _put(prepared, _DONE)
+
+    errors: list = []
+
+    def _consumer() -> None:
+        while True:
+            item = _get(finished)
+            if item is _DONE:
+                return
+            try:
+                post(item)
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+                return
+
+    producer = threading.Thread(target=_producer, name="prefetch-prepare", daemon=True)
+    consumer = threading.Thread(target=_consumer, name="prefetch-post", daemon=True)
+    producer.start()
+    consumer.start()
+    try:
+        while True:
+            item = _get(prepared)
+            if item is _DONE:
+                break
+            if isinstance(item, _Failed):
+                raise item.exc
+            if not _put(finished, infer(item)):
+                break
+        _put(finished, _DONE)
+        consumer.join()
+    finally:
+        stop.set()
+        consumer.join()
+        producer.join()
+    if errors:
+        raise errors[0]
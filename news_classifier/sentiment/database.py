@@ -1,21 +1,27 @@
+from psycopg2 import sql
 from psycopg2.extensions import connection as PGConnection
 import pandas as pd
+from news_classifier.partitions import ensure_partitions_for
 
-def ensure_sentiment_table(conn: PGConnection) -> None:
+def ensure_sentiment_table(conn: PGConnection, table: str = "message_sentiment", messages_table: str = "messages") -> None:
+    # Partitioned by month like messages; date_unix is copied from the message
     cur = conn.cursor()
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS message_sentiment (
-            channel TEXT NOT NULL,
-            id BIGINT NOT NULL,
-            positive REAL NOT NULL,
-            neutral REAL NOT NULL,
-            negative REAL NOT NULL,
-            created_at INTEGER,
-            PRIMARY KEY (channel, id),
-            FOREIGN KEY (channel, id) REFERENCES messages(channel, id) ON DELETE CASCADE
-        )
-        """
+        sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {table} (
+                channel TEXT NOT NULL,
+                id BIGINT NOT NULL,
+                date_unix BIGINT NOT NULL,
+                positive REAL NOT NULL,
+                neutral REAL NOT NULL,
+                negative REAL NOT NULL,
+                created_at INTEGER,
+                PRIMARY KEY (channel, id, date_unix),
+                FOREIGN KEY (channel, id, date_unix) REFERENCES {messages}(channel, id, date_unix) ON DELETE CASCADE
+            ) PARTITION BY RANGE (date_unix)
+            """
+        ).format(table=sql.Identifier(table), messages=sql.Identifier(messages_table))
     )
     conn.commit()
 
@@ -30,7 +36,7 @@ def insert_sentiment_rows(conn: PGConnection, rows: pd.DataFrame) -> int:
         return 0
         
     # Required sentiment fields; created_at is optional and will be set to now if missing
-    required = ["channel", "id", "positive", "neutral", "negative"]
+    required = ["channel", "id", "date_unix", "positive", "neutral", "negative"]
     missing = [c for c in required if c not in rows.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
@@ -47,15 +53,16 @@ def insert_sentiment_rows(conn: PGConnection, rows: pd.DataFrame) -> int:
     # Coerce types; created_at may have NaNs -> fill with now
     df["channel"] = df["channel"].astype(str)
     df["id"] = df["id"].astype(int)
+    df["date_unix"] = df["date_unix"].astype(int)
     df["positive"] = df["positive"].astype(float)
     df["neutral"] = df["neutral"].astype(float)
     df["negative"] = df["negative"].astype(float)
     df["created_at"] = df["created_at"].apply(lambda x: int(x) if pd.notna(x) else now_unix)
 
-    sql = """
-    INSERT INTO message_sentiment (channel, id, positive, neutral, negative, created_at)
-    VALUES (%s, %s, %s, %s, %s, %s)
-    ON CONFLICT(channel, id) DO UPDATE SET
+    query = """
+    INSERT INTO message_sentiment (channel, id, date_unix, positive, neutral, negative, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT(channel, id, date_unix) DO UPDATE SET
         positive=excluded.positive,
         neutral=excluded.neutral,
         negative=excluded.negative,
@@ -64,7 +71,8 @@ def insert_sentiment_rows(conn: PGConnection, rows: pd.DataFrame) -> int:
     data = list(df.itertuples(index=False, name=None))
     if not data:
         return 0
+    ensure_partitions_for(conn, "message_sentiment", df["date_unix"].unique().tolist())
     cur = conn.cursor()
-    cur.executemany(sql, data)
+    cur.executemany(query, data)
     conn.commit()
     return len(data)
\ No newline at end of file
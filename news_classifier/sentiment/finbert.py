@@ -1,19 +1,29 @@
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-import torch
-from typing import List, Dict, Tuple, Optional
+from __future__ import annotations
+import numpy as np
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
 import contextlib
+from news_classifier.model_cache import load_sequence_classifier
+from news_classifier.prefetch import run_pipelined
 
-def load_model():
+# torch / transformers are imported on first use: importing this module stays cheap
+if TYPE_CHECKING:
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+def load_model(cache_dir: Optional[str] = None):
+    """
+    Weights are memory-mapped; see news_classifier.model_cache for the optional
+    serialised cache (cache_dir or NEWS_CLASSIFIER_MODEL_CACHE).
+    """
     path = "/home/ian/ai_models/finbert"
     try:
-        tokenizer = AutoTokenizer.from_pretrained(path)
-        model = AutoModelForSequenceClassification.from_pretrained(path)
-        return tokenizer, model
+        return load_sequence_classifier(path, cache_dir=cache_dir)
     except Exception as e:
         print(f"Error loading model: {e}")
         return None, None
 
 def get_device() -> torch.device:
+    import torch
     if torch.cuda.is_available():
         return torch.device("cuda")
     return torch.device("cpu")
@@ -35,7 +45,17 @@ def _ensure_id2label(model) -> Dict[int, str]:
         return {i: f"LABEL_{i}" for i in range(num_labels)}
     return default_labels
 
-def predict_proba(
+def _autocast_ctx(device: torch.device, amp_dtype: Optional[str]):
+    import torch
+    _dtype = None
+    if device.type == "cuda":
+        if amp_dtype in ("fp16", "float16"):
+            _dtype = torch.float16
+        elif amp_dtype in ("bf16", "bfloat16"):
+            _dtype = torch.bfloat16
+    return torch.amp.autocast("cuda", dtype=_dtype) if _dtype is not None else contextlib.nullcontext()
+
+def predict_proba_array(
     texts: List[str],
     tokenizer: AutoTokenizer,
     model: AutoModelForSequenceClassification,
@@ -43,11 +63,17 @@ def predict_proba(
     max_length: int = 128,
     batch_size: int = 64,
     amp_dtype: Optional[str] = None,
-) -> List[Dict[str, float]]:
+    pipelined: bool = False,
+    prefetch: int = 2,
+) -> Tuple[np.ndarray, List[str]]:
     """
-    Returns class probabilities for each input text as a dict: {label: prob}.
+    Returns (probs, labels): a float32 matrix of shape (n_texts, n_labels) and
+    the label of each column (ordered by class id).
     Processes texts in batches to avoid GPU OOM.
+    With pipelined=True, batches are tokenized on a background thread (up to
+    `prefetch` ahead) and copied back on another, overlapping the forward pass.
     """
+    import torch
     if tokenizer is None or model is None:
         raise ValueError("Tokenizer and model must be loaded before prediction.")
     if device is None:
@@ -55,39 +81,73 @@ def predict_proba(
 
     model = model.to(device)
     model.eval()
-    
+
     id2label = _ensure_id2label(model)
-    results: List[Dict[str, float]] = []
-    # Determine autocast dtype policy
-    _dtype = None
-    if device.type == "cuda":
-        if amp_dtype in ("fp16", "float16"):
-            _dtype = torch.float16
-        elif amp_dtype in ("bf16", "bfloat16"):
-            _dtype = torch.bfloat16
-    autocast_ctx = torch.amp.autocast("cuda", dtype=_dtype) if _dtype is not None else contextlib.nullcontext()
+    labels = [id2label[i] for i in range(len(id2label))]
+    probs_out = np.empty((len(texts), len(labels)), dtype=np.float32)
+    autocast_ctx = _autocast_ctx(device, amp_dtype)
 
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
+    def prepare(i: int):
         enc = tokenizer(
-            batch,
+            texts[i : i + batch_size],
             padding=True,
             truncation=True,
             max_length=max_length,
             return_tensors="pt",
         )
-        enc = {k: v.to(device) for k, v in enc.items()}
+        if pipelined and device.type == "cuda":
+            # Pinned memory lets the host->device copy overlap the running batch
+            return i, {k: v.pin_memory().to(device, non_blocking=True) for k, v in enc.items()}
+        return i, {k: v.to(device) for k, v in enc.items()}
+
+    def infer(item):
+        i, enc = item
         with torch.no_grad():
             with autocast_ctx:
                 out = model(**enc)
                 logits = out.logits  # [batch, num_labels]
                 probs = torch.softmax(logits, dim=-1)  # [batch, num_labels]
-        for row in probs.cpu():
-            d = {id2label[i]: float(row[i]) for i in range(row.numel())}
-            results.append(d)
-        if device.type == "cuda":
-            torch.cuda.empty_cache()
-    return results
+        return i, probs
+
+    def post(item):
+        i, probs = item
+        probs_out[i : i + probs.shape[0]] = probs.float().cpu().numpy()
+
+    starts = range(0, len(texts), batch_size)
+    if pipelined:
+        run_pipelined(starts, prepare, infer, post, prefetch=prefetch)
+    else:
+        for i in starts:
+            post(infer(prepare(i)))
+            if device.type == "cuda":
+                torch.cuda.empty_cache()
+    return probs_out, labels
+
+def predict_proba(
+    texts: List[str],
+    tokenizer: AutoTokenizer,
+    model: AutoModelForSequenceClassification,
+    device: Optional[torch.device] = None,
+    max_length: int = 128,
+    batch_size: int = 64,
+    amp_dtype: Optional[str] = None,
+    pipelined: bool = False,
+) -> List[Dict[str, float]]:
+    """
+    Returns class probabilities for each input text as a dict: {label: prob}.
+    Prefer predict_proba_array for large inputs.
+    """
+    probs, labels = predict_proba_array(
+        texts,
+        tokenizer,
+        model,
+        device=device,
+        max_length=max_length,
+        batch_size=batch_size,
+        amp_dtype=amp_dtype,
+        pipelined=pipelined,
+    )
+    return [dict(zip(labels, row)) for row in probs.tolist()]
 
 def classify(
     texts: List[str],
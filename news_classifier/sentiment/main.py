@@ -1,62 +1,83 @@
 from typing import List
+import numpy as np
 import pandas as pd
 import psycopg2
 import logging
 import news_classifier.sentiment.finbert as finbert
 from news_classifier.sentiment.database import ensure_sentiment_table, insert_sentiment_rows
-from news_classifier.utils import timeit, get_db_news
+from news_classifier.utils import timeit, get_db_news, plan_score_reuse, apply_score_reuse
+from news_classifier.autotune import apply_profile
+from news_classifier.sketches import try_update_sketches
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+SCORE_COLS = ['positive', 'neutral', 'negative']
+# Near-duplicates at least this similar to an already scored message reuse its scores
+REUSE_MIN_SIMILARITY = 0.9
+
 @timeit
-def build_sentiment_dataframe(news: pd.DataFrame) -> pd.DataFrame:
+def build_sentiment_dataframe(news: pd.DataFrame, pipelined: bool = True) -> pd.DataFrame:
     """
     Builds a sentiment DataFrame with columns:
-      ['channel', 'id', 'positive', 'neutral', 'negative']
-    from the input news DataFrame. Expects 'text', 'channel' and 'id' columns.
+      ['channel', 'id', 'date_unix', 'positive', 'neutral', 'negative']
+    from the input news DataFrame. Expects 'text', 'channel', 'id' and 'date_unix' columns.
+    pipelined overlaps tokenization with inference (see finbert.predict_proba_array).
     """
     if news.empty:
         return pd.DataFrame()
     
-    required = {'text', 'channel', 'id'}
+    required = {'text', 'channel', 'id', 'date_unix'}
     missing = required - set(news.columns)
     if missing:
         raise ValueError(f"Input DataFrame must contain columns: {sorted(missing)}")
     texts = news['text'].astype(str).tolist()
     tokenizer, model = finbert.load_model()
-    probs_list = finbert.classify(texts, tokenizer, model, only_probs=True)
-    probs_df = pd.DataFrame(probs_list)
-    # Normalize keys to lowercase and ensure all expected columns exist
-    probs_df.columns = [str(c).lower() for c in probs_df.columns]
-    for col in ('positive', 'neutral', 'negative'):
-        if col not in probs_df.columns:
-            probs_df[col] = 0.0
-    probs_df = probs_df[['positive', 'neutral', 'negative']].reset_index(drop=True)
-    out = pd.concat(
-        [news[['channel', 'id']].reset_index(drop=True), probs_df],
-        axis=1
-    )
+    # Tuned batch_size / max_length / threads for this host, if autotune has run here
+    params = apply_profile("finbert")
+    probs, labels = finbert.predict_proba_array(texts, tokenizer, model, pipelined=pipelined, **params)
+    # Normalize labels to lowercase and pick the expected columns (missing -> 0.0)
+    col_of = {str(l).lower(): j for j, l in enumerate(labels)}
+    out_cols = SCORE_COLS
+    scores = np.zeros((len(texts), len(out_cols)), dtype=np.float32)
+    for k, col in enumerate(out_cols):
+        if col in col_of:
+            scores[:, k] = probs[:, col_of[col]]
+    out = pd.DataFrame(scores, columns=out_cols)
+    out.insert(0, 'date_unix', news['date_unix'].to_numpy())
+    out.insert(0, 'id', news['id'].to_numpy())
+    out.insert(0, 'channel', news['channel'].to_numpy())
     return out
 
-def main() -> None:
+def main(reuse_min_similarity: float | None = REUSE_MIN_SIMILARITY) -> None:
     db_path = "postgresql://ian@localhost:5432/telegram_news"
     # Get news to process
     conn = psycopg2.connect(db_path)
     ensure_sentiment_table(conn)
     df = get_db_news(conn, table="message_sentiment")
+    if reuse_min_similarity is not None:
+        df_todo, followers, rep_scores = plan_score_reuse(
+            conn, df, "message_sentiment", SCORE_COLS, reuse_min_similarity
+        )
+    else:
+        df_todo, followers, rep_scores = df, pd.DataFrame(), pd.DataFrame()
     conn.close()
-    logger.info(f"Got {len(df)} news rows")
+    logger.info(f"Got {len(df)} news rows ({len(followers)} near-duplicates reuse existing scores)")
     
     # process sentiment
-    df_sentiment = build_sentiment_dataframe(df)
-    logger.info(f"Built {len(df_sentiment)} sentiment rows")
+    df_sentiment = build_sentiment_dataframe(df_todo)
+    df_sentiment = apply_score_reuse(df_sentiment, followers, rep_scores, SCORE_COLS)
+    logger.info(
+        f"Built {len(df_sentiment)} sentiment rows, inference avoided for "
+        f"{len(df) - len(df_todo)}/{len(df)} ({100 * (len(df) - len(df_todo)) / max(len(df), 1):.1f}%)"
+    )
 
     # Insert sentiment rows to the sentiment table
     conn = psycopg2.connect(db_path)
     n_inserted = insert_sentiment_rows(conn, df_sentiment)
     conn.close()
     logger.info(f"Sentiment rows inserted: {n_inserted}")
+    try_update_sketches(db_path)
 
 if __name__ == "__main__":
     # Example: load from DB, enrich, and write back to the same table (requires appropriate schema)
@@ -0,0 +1,116 @@
+"""
+Dynamic request coalescing for single-text inference requests.
+
+Callers submit one text at a time; a worker thread drains the queue into
+batches (up to max_batch_size, or whatever arrived before max_wait_ms
+elapsed) and runs one forward pass per batch.
+"""
+from concurrent.futures import Future
+from typing import Any, Callable, List, Tuple
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the request queue is at capacity (backpressure)."""
+
+
+class DynamicBatcher:
+    def __init__(
+        self,
+        predict_fn: Callable[[List[str]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10.0,
+        max_queue_size: int = 1024,
+        name: str = "batcher",
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self) -> "DynamicBatcher":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None) -> None:
+        """
+        Stop the worker and fail requests still queued, so their callers do
+        not wait forever.
+        """
+        self._stop.set()
+        self._thread.join(timeout)
+        while True:
+            try:
+                _, fut = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if fut.set_running_or_notify_cancel():
+                fut.set_exception(RuntimeError(f"{self.name}: stopped"))
+
+    def submit(self, text: str) -> Future:
+        """
+        Enqueue one text and return a Future resolving to its result.
+        Raises QueueFullError instead of blocking when the queue is full.
+        """
+        if self._stop.is_set():
+            raise RuntimeError(f"{self.name}: stopped")
+        fut: Future = Future()
+        try:
+            self._queue.put_nowait((text, fut))
+        except queue.Full:
+            raise QueueFullError(f"{self.name}: queue is full ({self._queue.maxsize})")
+        return fut
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            # Drop requests whose caller already gave up
+            batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            texts = [t for t, _ in batch]
+            try:
+                results = self.predict_fn(texts)
+            except Exception as e:
+                logger.error(f"[{self.name}] batch of {len(texts)} failed: {e}")
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            if len(results) != len(batch):
+                e = RuntimeError(f"{self.name}: predict_fn returned {len(results)} results for {len(batch)} texts")
+                logger.error(str(e))
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                fut.set_result(res)
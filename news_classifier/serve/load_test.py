@@ -0,0 +1,116 @@
+"""
+Load test for the local inference service.
+
+Fires single-text requests at increasing concurrency levels and reports
+throughput (req/s) and p50/p99 latency for each level.
+
+Usage:
+  python -m news_classifier.serve.load_test --endpoint sentiment --concurrency 1,4,16,64
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException
+from typing import List
+import json
+import socket
+import threading
+import time
+
+SAMPLE_TEXTS = [
+    "Stocks rallied after the central bank signalled a pause in rate hikes.",
+    "Oil prices fell as OPEC output rose more than expected.",
+    "The company reported a quarterly loss and cut its full-year guidance.",
+    "Lawmakers passed the budget bill after weeks of negotiations.",
+    "Tensions escalated at the border as both sides deployed more troops.",
+    "The startup raised $50 million to expand its AI platform.",
+]
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path: str, timeout: float = 60.0):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run_level(make_conn, endpoint: str, concurrency: int, n_requests: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(n: int) -> None:
+        nonlocal errors
+        conn = make_conn()
+        for i in range(n):
+            body = json.dumps({"text": SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]})
+            start = time.perf_counter()
+            try:
+                conn.request("POST", f"/{endpoint}", body=body, headers={"Content-Type": "application/json"})
+                resp = conn.getresponse()
+                resp.read()
+                ok = resp.status == 200
+            except (OSError, HTTPException):
+                ok = False
+                conn.close()
+                conn = make_conn()
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+        conn.close()
+
+    per_worker = max(1, n_requests // concurrency)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        list(ex.map(worker, [per_worker] * concurrency))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "errors": errors,
+        "req_per_s": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--endpoint", default="sentiment", choices=["sentiment", "tag"])
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=512, help="Requests per concurrency level")
+    args = parser.parse_args()
+
+    if args.unix_socket:
+        make_conn = lambda: UnixHTTPConnection(args.unix_socket)
+    else:
+        make_conn = lambda: HTTPConnection(args.host, args.port, timeout=60.0)
+
+    print(f"{'conc':>6} {'ok':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for level in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        r = run_level(make_conn, args.endpoint, level, args.requests)
+        print(
+            f"{r['concurrency']:>6} {r['ok']:>7} {r['errors']:>5} "
+            f"{r['req_per_s']:>9.1f} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
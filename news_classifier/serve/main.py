@@ -0,0 +1,156 @@
+"""
+Local inference service hosting FinBERT (sentiment) and BART-large-MNLI (tags).
+
+Concurrent single-text requests are coalesced into batches by DynamicBatcher,
+so clients get batch-level throughput without loading the models themselves.
+
+Endpoints (JSON):
+  POST /sentiment  {"text": "..."} -> {"positive": p, "neutral": p, "negative": p}
+  POST /tag        {"text": "..."} -> {<normalized label>: score, ...}
+  GET  /health     -> queue sizes
+
+Usage:
+  python -m news_classifier.serve.main --port 8765
+  python -m news_classifier.serve.main --unix-socket /tmp/news_classifier.sock
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+from typing import Dict, List
+import json
+import logging
+import os
+
+import news_classifier.sentiment.finbert as finbert
+import news_classifier.tag.bart_large_mnli as bart
+from news_classifier.tag.labels import LABELS, _norm
+from news_classifier.serve.batcher import DynamicBatcher, QueueFullError
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_sentiment_fn(amp_dtype: str | None = None):
+    tokenizer, model = finbert.load_model()
+    device = finbert.get_device()
+
+    def predict(texts: List[str]) -> List[Dict[str, float]]:
+        probs, labels = finbert.predict_proba_array(
+            texts, tokenizer, model, device=device, batch_size=len(texts), amp_dtype=amp_dtype
+        )
+        keys = [str(l).lower() for l in labels]
+        return [dict(zip(keys, row)) for row in probs.tolist()]
+    return predict
+
+
+def make_tag_fn(amp_dtype: str | None = "bf16"):
+    tokenizer, model = bart.load_model()
+    device = bart.get_device()
+
+    def predict(texts: List[str]) -> List[Dict[str, float]]:
+        scores, labels = bart.zero_shot_scores(
+            texts,
+            candidate_labels=LABELS,
+            multi_label=True,
+            tokenizer=tokenizer,
+            model=model,
+            device=device,
+            batch_size=len(texts),
+            amp_dtype=amp_dtype,
+        )
+        keys = [_norm(l) for l in labels]
+        return [dict(zip(keys, row)) for row in scores.tolist()]
+    return predict
+
+
+def make_handler(batchers: Dict[str, DynamicBatcher], request_timeout: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send(404, {"error": "not found"})
+            self._send(200, {name: {"queued": b.qsize()} for name, b in batchers.items()})
+
+        def do_POST(self):
+            batcher = batchers.get(self.path.strip("/"))
+            if batcher is None:
+                return self._send(404, {"error": "not found"})
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                text = json.loads(self.rfile.read(length) or b"{}")["text"]
+            except (ValueError, KeyError, TypeError):
+                return self._send(400, {"error": "expected JSON body {\"text\": ...}"})
+            try:
+                fut = batcher.submit(str(text))
+            except QueueFullError as e:
+                return self._send(503, {"error": str(e)})
+            try:
+                self._send(200, fut.result(timeout=request_timeout))
+            except TimeoutError:
+                fut.cancel()
+                self._send(504, {"error": "inference timed out"})
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            # client_address is empty on Unix sockets; log without it
+            logger.debug(format % args)
+
+    return Handler
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", default=None, help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--models", default="sentiment,tag", help="Comma-separated subset of: sentiment,tag")
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0, help="Max time to wait for a batch to fill")
+    parser.add_argument("--max-queue-size", type=int, default=1024, help="Pending requests before returning 503")
+    parser.add_argument("--request-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    factories = {"sentiment": make_sentiment_fn, "tag": make_tag_fn}
+    batchers: Dict[str, DynamicBatcher] = {}
+    for name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        if name not in factories:
+            raise ValueError(f"Unknown model: {name}. Allowed models are: {sorted(factories)}")
+        logger.info(f"Loading {name} model ...")
+        batchers[name] = DynamicBatcher(
+            factories[name](),
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            max_queue_size=args.max_queue_size,
+            name=name,
+        ).start()
+
+    handler = make_handler(batchers, args.request_timeout)
+    if args.unix_socket:
+        if os.path.exists(args.unix_socket):
+            os.unlink(args.unix_socket)
+        server = ThreadingUnixStreamServer(args.unix_socket, handler)
+        logger.info(f"Serving {sorted(batchers)} on unix:{args.unix_socket}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        logger.info(f"Serving {sorted(batchers)} on http://{args.host}:{args.port}")
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for b in batchers.values():
+            b.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
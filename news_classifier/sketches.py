@@ -0,0 +1,415 @@
+"""
+Mergeable quantile sketches of message sentiment per (window, category, channel).
+
+Each cell holds a t-digest of S = positive - negative over the messages of one
+channel in one week (Monday 00:00 Europe/Madrid, as in the Rmd). Messages are
+weighted by their category score C, and scores below CAT_THRESHOLD count as 0,
+which is the Rmd's hard threshold. Category '__all__' has every message with
+weight 1. A digest keeps at most about COMPRESSION centroids whatever the
+number of messages. Digests merge exactly like their raw data would, up to the sketch
+error, so quantiles for several channels or weeks come from merging cells
+without rescanning messages.
+
+Cells are updated incrementally by update_sketches(). It runs after each
+sentiment / tag insert and reads message_sentiment and message_tag_score
+directly. score_sketch_folded records what is already in the digests per
+(message, label_id), with label_id 0 for '__all__'. A message enters
+'__all__' once it has sentiment, and each category cell once that label is
+scored, so a label added later is folded in as the tagger fills it. Scores
+rewritten after they were sketched are not reflected (digests cannot delete
+points); `rebuild` recomputes everything.
+
+Usage:
+  python -m news_classifier.sketches update
+  python -m news_classifier.sketches rebuild
+  python -m news_classifier.sketches quantiles --category economics_finance_and_markets --q 0.1,0.5,0.9 [--channel URL] [--since 2024-01-01] [--by-week]
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+import logging
+import math
+import time
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2.extensions import connection as PGConnection
+
+from news_classifier.tag.database import get_labels
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION = 100
+CAT_THRESHOLD = 0.25
+ALL_CATEGORIES = "__all__"
+# pg_advisory_xact_lock key serialising update_sketches batches
+SKETCH_LOCK_ID = 0x534b4554
+TIMEZONE = ZoneInfo("Europe/Madrid")
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning) with the k1 scale function. Centroids are
+    kept sorted by mean; min/max are exact.
+    """
+
+    def __init__(self, compression: float = COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> None:
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = float(weights.sum())
+        out_m: List[float] = []
+        out_w: List[float] = []
+        cum = 0.0  # weight left of the open centroid
+        cur_m, cur_w = float(means[0]), float(weights[0])
+        k_left = self._k(0.0)
+        for m, w in zip(means[1:].tolist(), weights[1:].tolist()):
+            if self._k((cum + cur_w + w) / total) - k_left <= 1:
+                cur_m += (m - cur_m) * w / (cur_w + w)
+                cur_w += w
+            else:
+                out_m.append(cur_m)
+                out_w.append(cur_w)
+                cum += cur_w
+                k_left = self._k(cum / total)
+                cur_m, cur_w = m, w
+        out_m.append(cur_m)
+        out_w.append(cur_w)
+        self.means = np.asarray(out_m, dtype=np.float64)
+        self.weights = np.asarray(out_w, dtype=np.float64)
+
+    def update(self, values: Sequence[float], weights: Optional[Sequence[float]] = None) -> "TDigest":
+        values = np.asarray(values, dtype=np.float64)
+        weights = np.ones_like(values) if weights is None else np.asarray(weights, dtype=np.float64)
+        keep = (weights > 0) & np.isfinite(values)
+        values, weights = values[keep], weights[keep]
+        if len(values) == 0:
+            return self
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, weights]))
+        return self
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        if len(other.means) == 0:
+            return self
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def quantile(self, q: Sequence[float]) -> np.ndarray:
+        q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if len(self.means) == 0:
+            return np.full(q.shape, np.nan)
+        if len(self.means) == 1:
+            return np.full(q.shape, self.means[0])
+        total = self.weights.sum()
+        # Centroid i sits at the middle of its weight; ends are pinned to min/max
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate([[0.0], centers, [total]])
+        ys = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(q * total, xs, ys)
+
+    def mean(self) -> float:
+        return float(np.average(self.means, weights=self.weights)) if len(self.means) else float("nan")
+
+    def to_bytes(self) -> bytes:
+        header = np.array([self.compression, self.min, self.max, len(self.means)], dtype=np.float64)
+        return np.concatenate([header, self.means, self.weights]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "TDigest":
+        arr = np.frombuffer(data, dtype=np.float64)
+        compression, lo, hi, n = arr[:4]
+        n = int(n)
+        d = cls(compression)
+        d.min, d.max = float(lo), float(hi)
+        d.means = arr[4 : 4 + n].copy()
+        d.weights = arr[4 + n : 4 + 2 * n].copy()
+        return d
+
+
+def week_start(ts: int) -> int:
+    """
+    Unix time of the Monday 00:00 (Europe/Madrid) starting the week of `ts`.
+    """
+    d = datetime.fromtimestamp(int(ts), tz=TIMEZONE)
+    monday = (d - timedelta(days=d.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(monday.timestamp())
+
+
+def ensure_sketch_tables(conn: PGConnection) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS score_sketch (
+            window_start BIGINT NOT NULL,
+            category TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            digest BYTEA NOT NULL,
+            weight DOUBLE PRECISION NOT NULL,
+            n_messages BIGINT NOT NULL,
+            updated_at BIGINT,
+            PRIMARY KEY (window_start, category, channel)
+        )
+        """
+    )
+    # (message, label_id) pairs already folded into score_sketch; label_id 0 is ALL_CATEGORIES
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS score_sketch_folded (
+            channel TEXT NOT NULL,
+            id BIGINT NOT NULL,
+            date_unix BIGINT NOT NULL,
+            label_id INTEGER NOT NULL,
+            PRIMARY KEY (channel, id, date_unix, label_id)
+        )
+        """
+    )
+    cur.execute("SELECT to_regclass('score_sketch_message')")
+    if cur.fetchone()[0] is not None:
+        # Per-message tracking could not tell which labels were folded: start over
+        logger.warning("Replacing score_sketch_message with per-label tracking; sketches will be rebuilt")
+        cur.execute("DROP TABLE score_sketch_message")
+        cur.execute("TRUNCATE score_sketch, score_sketch_folded")
+    conn.commit()
+
+
+def _pending(conn: PGConnection, max_rows: int) -> pd.DataFrame:
+    """
+    Up to max_rows (message, label_id) pairs not folded yet, with S and the
+    label score (1 for label_id 0). Both sides need sentiment.
+    """
+    return pd.read_sql_query(
+        """
+        (
+            SELECT s.channel, s.id, s.date_unix, 0 AS label_id, s.positive - s.negative AS s, 1.0::REAL AS score
+            FROM message_sentiment s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM score_sketch_folded f
+                WHERE f.channel = s.channel AND f.id = s.id AND f.date_unix = s.date_unix AND f.label_id = 0
+            )
+            LIMIT %s
+        )
+        UNION ALL
+        (
+            SELECT t.channel, t.id, t.date_unix, t.label_id, s.positive - s.negative AS s, t.score
+            FROM message_tag_score t
+            JOIN message_sentiment s ON s.channel = t.channel AND s.id = t.id AND s.date_unix = t.date_unix
+            WHERE NOT EXISTS (
+                SELECT 1 FROM score_sketch_folded f
+                WHERE f.channel = t.channel AND f.id = t.id AND f.date_unix = t.date_unix AND f.label_id = t.label_id
+            )
+            LIMIT %s
+        )
+        """,
+        conn,
+        params=[int(max_rows), int(max_rows)],
+    )
+
+
+def _cell_updates(df: pd.DataFrame, categories: Dict[int, str], cat_threshold: float) -> Dict[Tuple[int, str, str], Tuple[np.ndarray, np.ndarray]]:
+    """
+    {(window_start, category, channel): (values, weights)} for a batch of
+    (message, label_id) rows; cells whose weights are all 0 are left out.
+    """
+    score = df["score"].to_numpy(dtype=np.float64)
+    is_all = df["label_id"].to_numpy() == 0
+    df = df.assign(
+        window_start=[week_start(ts) for ts in df["date_unix"].tolist()],
+        category=[ALL_CATEGORIES if lid == 0 else categories[lid] for lid in df["label_id"].tolist()],
+        weight=np.where(is_all, 1.0, np.where(score >= cat_threshold, score, 0.0)),
+    )
+    cells = {}
+    for (window, category, channel), g in df.groupby(["window_start", "category", "channel"], sort=False):
+        w = g["weight"].to_numpy(dtype=np.float64)
+        if w.any():
+            cells[(int(window), category, channel)] = (g["s"].to_numpy(dtype=np.float64), w)
+    return cells
+
+
+def update_sketches(conn: PGConnection, cat_threshold: float = CAT_THRESHOLD, batch_size: int = 50000) -> int:
+    """
+    Fold newly scored (message, label) pairs into their cells. Concurrent
+    callers are serialised batch by batch with an advisory lock.
+    Returns number of (message, label) pairs added.
+    """
+    ensure_sketch_tables(conn)
+    labels = get_labels(conn)
+    categories = dict(zip(labels["label_id"].astype(int), labels["column_name"]))
+    total = 0
+    cur = conn.cursor()
+    while True:
+        # Sentiment and tag runs can overlap; without the lock both would fold
+        # the same pending messages. Released by the commit (or rollback).
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (SKETCH_LOCK_ID,))
+        df = _pending(conn, batch_size)
+        if df.empty:
+            conn.commit()
+            break
+        cells = _cell_updates(df, categories, cat_threshold)
+        keys = list(cells)
+        cur.execute(
+            """
+            SELECT window_start, category, channel, digest, n_messages
+            FROM score_sketch
+            WHERE (window_start, category, channel) IN (
+                SELECT * FROM unnest(%s::bigint[], %s::text[], %s::text[])
+            )
+            FOR UPDATE
+            """,
+            ([k[0] for k in keys], [k[1] for k in keys], [k[2] for k in keys]),
+        )
+        existing = {(w, c, ch): (TDigest.from_bytes(bytes(d)), n) for w, c, ch, d, n in cur.fetchall()}
+        rows = []
+        now = int(time.time())
+        for key, (values, weights) in cells.items():
+            digest, n = existing.get(key, (TDigest(), 0))
+            digest.update(values, weights)
+            rows.append((*key, psycopg2.Binary(digest.to_bytes()), digest.count, n + int((weights > 0).sum()), now))
+        cur.executemany(
+            """
+            INSERT INTO score_sketch (window_start, category, channel, digest, weight, n_messages, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (window_start, category, channel) DO UPDATE SET
+                digest = excluded.digest,
+                weight = excluded.weight,
+                n_messages = excluded.n_messages,
+                updated_at = excluded.updated_at
+            """,
+            rows,
+        )
+        cur.execute(
+            """
+            INSERT INTO score_sketch_folded (channel, id, date_unix, label_id)
+            SELECT * FROM unnest(%s::text[], %s::bigint[], %s::bigint[], %s::int[])
+            ON CONFLICT DO NOTHING
+            """,
+            (
+                df["channel"].astype(str).tolist(),
+                df["id"].astype(int).tolist(),
+                df["date_unix"].astype(int).tolist(),
+                df["label_id"].astype(int).tolist(),
+            ),
+        )
+        conn.commit()
+        total += len(df)
+        logger.info(f"Sketched {len(df)} (message, label) scores into {len(cells)} cells")
+    return total
+
+
+def try_update_sketches(dsn: str) -> None:
+    """
+    update_sketches for the scoring jobs: the sketches are a side product, so
+    a failure is logged instead of failing the run.
+    """
+    conn = psycopg2.connect(dsn)
+    try:
+        n = update_sketches(conn)
+        logger.info(f"Added {n} scores to the quantile sketches")
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Sketch update failed: {e}")
+    finally:
+        conn.close()
+
+
+def rebuild_sketches(conn: PGConnection, cat_threshold: float = CAT_THRESHOLD) -> int:
+    ensure_sketch_tables(conn)
+    cur = conn.cursor()
+    cur.execute("TRUNCATE score_sketch, score_sketch_folded")
+    conn.commit()
+    return update_sketches(conn, cat_threshold)
+
+
+def load_sketches(
+    conn: PGConnection,
+    category: str = ALL_CATEGORIES,
+    channels: Optional[Sequence[str]] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Cells for one category: columns ['window_start', 'channel', 'n_messages', 'digest' (TDigest)].
+    """
+    query = "SELECT window_start, channel, n_messages, digest FROM score_sketch WHERE category = %s"
+    params: list = [category]
+    if channels is not None:
+        query += " AND channel = ANY(%s::text[])"
+        params.append(list(channels))
+    if since is not None:
+        query += " AND window_start >= %s"
+        params.append(week_start(since))
+    if until is not None:
+        query += " AND window_start < %s"
+        params.append(int(until))
+    cur = conn.cursor()
+    cur.execute(query + " ORDER BY window_start, channel", params)
+    rows = [(w, ch, n, TDigest.from_bytes(bytes(d))) for w, ch, n, d in cur.fetchall()]
+    return pd.DataFrame(rows, columns=["window_start", "channel", "n_messages", "digest"])
+
+
+def merged_quantiles(cells: pd.DataFrame, qs: Sequence[float], by: Optional[str] = None) -> pd.DataFrame:
+    """
+    Merge the digests of `cells` (all of them, or per value of column `by`)
+    and return mean and quantiles of S.
+    """
+    groups = [(None, cells)] if by is None else list(cells.groupby(by, sort=True))
+    out = []
+    for key, g in groups:
+        merged = TDigest()
+        for d in g["digest"]:
+            merged.merge(d)
+        row = {} if by is None else {by: key}
+        row.update({"n_messages": int(g["n_messages"].sum()), "weight": merged.count, "mean": merged.mean()})
+        row.update({f"q{q:g}": v for q, v in zip(qs, merged.quantile(qs))})
+        out.append(row)
+    return pd.DataFrame(out)
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("update", help="Fold newly scored messages into the sketches")
+    sub.add_parser("rebuild", help="Recompute every sketch from the score tables")
+    p_q = sub.add_parser("quantiles", help="Quantiles of S merged over channels / weeks")
+    p_q.add_argument("--category", default=ALL_CATEGORIES)
+    p_q.add_argument("--channel", action="append", default=None, help="Repeat for several channels (default: all)")
+    p_q.add_argument("--since", default=None, help="YYYY-MM-DD")
+    p_q.add_argument("--until", default=None, help="YYYY-MM-DD (exclusive)")
+    p_q.add_argument("--q", default="0.05,0.25,0.5,0.75,0.95")
+    p_q.add_argument("--by-week", action="store_true", help="One row per week instead of one overall")
+    p_q.add_argument("--by-channel", action="store_true", help="One row per channel instead of one overall")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+    if args.cmd == "update":
+        logger.info(f"Added {update_sketches(conn)} scores")
+    elif args.cmd == "rebuild":
+        logger.info(f"Rebuilt sketches from {rebuild_sketches(conn)} scores")
+    else:
+        to_unix = lambda s: int(datetime.strptime(s, "%Y-%m-%d").replace(tzinfo=TIMEZONE).timestamp()) if s else None
+        cells = load_sketches(conn, args.category, args.channel, to_unix(args.since), to_unix(args.until))
+        by = "window_start" if args.by_week else "channel" if args.by_channel else None
+        result = merged_quantiles(cells, [float(q) for q in args.q.split(",")], by=by)
+        if by == "window_start":
+            result["window_start"] = pd.to_datetime(result["window_start"], unit="s", utc=True).dt.tz_convert(TIMEZONE)
+        print(result.to_string(index=False))
+    conn.close()
@@ -0,0 +1,118 @@
+"""
+Cold-start check for the CLI entry points and a model worker.
+
+Each measurement runs in a fresh interpreter:
+  - import: `import <module>` for the CLI entry points (no model work);
+  - worker: import + load_model() + first prediction on one text, with the
+    model cache from NEWS_CLASSIFIER_MODEL_CACHE / --cache-dir if set
+    (run twice: the first run fills the cache).
+
+Exits with status 1 when a median is above its target.
+
+Usage:
+  python -m news_classifier.startup
+  python -m news_classifier.startup --cache-dir ~/.cache/news_classifier --repeats 5
+"""
+from typing import Dict, List
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ENTRY_POINTS = [
+    "news_classifier.sentiment.main",
+    "news_classifier.tag.main",
+    "news_classifier.serve.main",
+    "news_classifier.telegram_news.main",
+]
+
+# Seconds, median of the repeats
+IMPORT_TARGET_S = 1.0
+WORKER_TARGET_S = {"sentiment": 4.0, "tag": 8.0}
+
+
+def _child_worker(kind: str) -> None:
+    timings = {}
+    t0 = time.perf_counter()
+    if kind == "sentiment":
+        import news_classifier.sentiment.finbert as finbert
+        timings["import"] = time.perf_counter() - t0
+        tokenizer, model = finbert.load_model()
+        timings["load"] = time.perf_counter() - t0
+        finbert.predict_proba_array(["Stocks rallied after the rate decision."], tokenizer, model)
+    else:
+        import news_classifier.tag.bart_large_mnli as bart
+        from news_classifier.tag.labels import LABELS
+        timings["import"] = time.perf_counter() - t0
+        tokenizer, model = bart.load_model()
+        timings["load"] = time.perf_counter() - t0
+        bart.zero_shot_scores(
+            ["Stocks rallied after the rate decision."], LABELS, tokenizer=tokenizer, model=model, pipelined=True
+        )
+    timings["first_prediction"] = time.perf_counter() - t0
+    print(json.dumps(timings))
+
+
+def _run(args: List[str], env: Dict[str, str]) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], check=True, env=env, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def _run_worker(kind: str, env: Dict[str, str]) -> Dict[str, float]:
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-m", "news_classifier.startup", "--child", kind],
+        check=True, env=env, capture_output=True, text=True,
+    )
+    timings = json.loads(out.stdout.strip().splitlines()[-1])
+    # Includes interpreter start-up, which the in-process timings miss
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--cache-dir", default=None, help="Model cache directory (default: $NEWS_CLASSIFIER_MODEL_CACHE)")
+    parser.add_argument("--workers", default="sentiment,tag", help="Comma-separated workers to time, or '' to skip")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child_worker(args.child)
+        return
+
+    env = dict(os.environ)
+    if args.cache_dir:
+        env["NEWS_CLASSIFIER_MODEL_CACHE"] = os.path.expanduser(args.cache_dir)
+    failed = False
+
+    for module in ENTRY_POINTS:
+        times = [_run(["-c", f"import {module}"], env) for _ in range(args.repeats)]
+        median = statistics.median(times)
+        ok = median <= IMPORT_TARGET_S
+        failed |= not ok
+        print(f"import {module:40s} median={median:.2f}s target={IMPORT_TARGET_S:.1f}s {'ok' if ok else 'SLOW'}")
+
+    for kind in [k for k in args.workers.split(",") if k]:
+        if env.get("NEWS_CLASSIFIER_MODEL_CACHE"):
+            _run_worker(kind, env)  # warm-up run writes the cache
+        runs = [_run_worker(kind, env) for _ in range(args.repeats)]
+        median = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+        ok = median["total"] <= WORKER_TARGET_S[kind]
+        failed |= not ok
+        print(
+            f"worker {kind:9s} import={median['import']:.2f}s load={median['load']:.2f}s "
+            f"first_prediction={median['first_prediction']:.2f}s total={median['total']:.2f}s "
+            f"target={WORKER_TARGET_S[kind]:.1f}s {'ok' if ok else 'SLOW'}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,32 @@
-from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
-import torch
-from typing import List, Dict, Tuple, Optional
+from __future__ import annotations
+import numpy as np
+from typing import TYPE_CHECKING, List, Dict, Tuple, Optional
 import contextlib
+import logging
+from news_classifier.model_cache import load_sequence_classifier
+from news_classifier.prefetch import run_pipelined
 
-def load_model(model_name_or_path: str = "facebook/bart-large-mnli"):
+# torch / transformers are imported on first use: importing this module stays cheap
+if TYPE_CHECKING:
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+def load_model(model_name_or_path: str = "facebook/bart-large-mnli", cache_dir: Optional[str] = None):
     """
     Load tokenizer and model for zero-shot classification (BART MNLI).
+    Weights are memory-mapped; see news_classifier.model_cache for the optional
+    serialised cache (cache_dir or NEWS_CLASSIFIER_MODEL_CACHE).
     """
     try:
-        tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
-        model = AutoModelForSequenceClassification.from_pretrained(model_name_or_path)
-        return tokenizer, model
+        return load_sequence_classifier(model_name_or_path, cache_dir=cache_dir)
     except Exception as e:
         print(f"Error loading model: {e}")
         return None, None
 
 def get_device() -> torch.device:
+    import torch
     if torch.cuda.is_available():
         return torch.device("cuda")
     return torch.device("cpu")
@@ -25,6 +36,7 @@ def _pipeline_from(
     model: AutoModelForSequenceClassification,
     device: torch.device,
 ):
+    from transformers import pipeline
     if device.type == "cuda":
         device_idx = 0 
     else:
@@ -36,10 +48,19 @@ def _pipeline_from(
         device=device_idx,
     )
 
-def zero_shot_top_k(
+def _autocast_ctx(device: Optional[torch.device], amp_dtype: Optional[str]):
+    import torch
+    _dtype = None
+    if device and device.type == "cuda":
+        if amp_dtype in ("fp16", "float16"):
+            _dtype = torch.float16
+        elif amp_dtype in ("bf16", "bfloat16"):
+            _dtype = torch.bfloat16
+    return torch.amp.autocast("cuda", dtype=_dtype) if _dtype is not None else contextlib.nullcontext()
+
+def zero_shot_scores(
     texts: List[str],
     candidate_labels: List[str],
-    k: int = 3,
     multi_label: bool = True,
     tokenizer: Optional[AutoTokenizer] = None,
     model: Optional[AutoModelForSequenceClassification] = None,
@@ -47,43 +68,151 @@ def zero_shot_top_k(
     hypothesis_template: str = "This example is about {}.",
     batch_size: int = 16,
     amp_dtype: Optional[str] = None,
-) -> List[List[Tuple[str, float]]]:
+    pipelined: bool = False,
+    prefetch: int = 2,
+    max_length: Optional[int] = None,
+) -> Tuple[np.ndarray, List[str]]:
     """
-    For each input text, return the top-k (label, score) pairs among candidate_labels.
+    Returns (scores, labels): a float32 matrix of shape (n_texts, n_labels) whose
+    columns follow the order of candidate_labels.
+    With pipelined=True the NLI pairs are tokenized on a background thread and
+    scored directly with the model instead of the HF pipeline (same scores).
+    max_length caps the premise + hypothesis tokens (default: the model's
+    limit). The HF pipeline path cannot apply it and logs a warning instead.
     """
     if tokenizer is None or model is None:
         tokenizer, model = load_model()
     if device is None:
         device = get_device()
+    if pipelined:
+        return _zero_shot_scores_pipelined(
+            texts, candidate_labels, multi_label, tokenizer, model, device,
+            hypothesis_template, batch_size, amp_dtype, prefetch, max_length,
+        )
+    if max_length is not None:
+        logger.warning(
+            f"max_length={max_length} is ignored with pipelined=False "
+            "(the HF zero-shot pipeline truncates at the model's limit)"
+        )
     pipe = _pipeline_from(tokenizer, model, device)
-    # Prepare autocast if CUDA
-    _dtype = None
-    if device and device.type == "cuda":
-        if amp_dtype in ("fp16", "float16"):
-            _dtype = torch.float16
-        elif amp_dtype in ("bf16", "bfloat16"):
-            _dtype = torch.bfloat16
-    autocast_ctx = torch.amp.autocast("cuda", dtype=_dtype) if _dtype is not None else contextlib.nullcontext()
+    autocast_ctx = _autocast_ctx(device, amp_dtype)
 
-    results: List[List[Tuple[str, float]]] = []
+    labels = list(candidate_labels)
+    label_index = {label: j for j, label in enumerate(labels)}
+    scores_out = np.zeros((len(texts), len(labels)), dtype=np.float32)
     for i in range(0, len(texts), batch_size):
         batch = texts[i : i + batch_size]
         with autocast_ctx:
             out = pipe(
                 batch,
-                candidate_labels=candidate_labels,
+                candidate_labels=labels,
                 multi_label=multi_label,
                 hypothesis_template=hypothesis_template,
             )
         if isinstance(out, dict):
             out = [out]
-        for o in out:
-            labels = o["labels"]
-            scores = o["scores"]
-            pairs = list(zip(labels, scores))
-            pairs = pairs[:k]
-            results.append(pairs)
-    return results
+        for r, o in enumerate(out):
+            # The pipeline sorts labels by score; scatter back to the fixed column order
+            cols = [label_index[label] for label in o["labels"]]
+            scores_out[i + r, cols] = o["scores"]
+    return scores_out, labels
+
+def _entailment_ids(model) -> Tuple[int, int]:
+    # Same lookup as the zero-shot pipeline: entailment by label name, contradiction = the other end
+    entailment_id = -1
+    for label, idx in model.config.label2id.items():
+        if label.lower().startswith("entail"):
+            entailment_id = int(idx)
+    contradiction_id = -1 if entailment_id == 0 else 0
+    return entailment_id, contradiction_id
+
+def _zero_shot_scores_pipelined(
+    texts: List[str],
+    candidate_labels: List[str],
+    multi_label: bool,
+    tokenizer: AutoTokenizer,
+    model: AutoModelForSequenceClassification,
+    device: torch.device,
+    hypothesis_template: str,
+    batch_size: int,
+    amp_dtype: Optional[str],
+    prefetch: int,
+    max_length: Optional[int] = None,
+) -> Tuple[np.ndarray, List[str]]:
+    import torch
+    model = model.to(device)
+    model.eval()
+    autocast_ctx = _autocast_ctx(device, amp_dtype)
+    labels = list(candidate_labels)
+    hypotheses = [hypothesis_template.format(label) for label in labels]
+    entailment_id, contradiction_id = _entailment_ids(model)
+    scores_out = np.zeros((len(texts), len(labels)), dtype=np.float32)
+
+    def prepare(i: int):
+        batch = texts[i : i + batch_size]
+        # One (premise, hypothesis) pair per text and label, text-major
+        premises = [t for t in batch for _ in hypotheses]
+        enc = tokenizer(
+            premises,
+            hypotheses * len(batch),
+            padding=True,
+            truncation="only_first",
+            max_length=max_length,
+            return_tensors="pt",
+        )
+        return i, len(batch), {k: v.to(device, non_blocking=True) for k, v in enc.items()}
+
+    def infer(item):
+        i, n, enc = item
+        with torch.no_grad():
+            with autocast_ctx:
+                logits = model(**enc).logits.float().view(n, len(labels), -1)
+            if multi_label or len(labels) == 1:
+                pair = logits[..., [contradiction_id, entailment_id]]
+                scores = torch.softmax(pair, dim=-1)[..., 1]
+            else:
+                scores = torch.softmax(logits[..., entailment_id], dim=-1)
+        return i, scores
+
+    def post(item):
+        i, scores = item
+        scores_out[i : i + scores.shape[0]] = scores.cpu().numpy()
+
+    run_pipelined(range(0, len(texts), batch_size), prepare, infer, post, prefetch=prefetch)
+    return scores_out, labels
+
+def zero_shot_top_k(
+    texts: List[str],
+    candidate_labels: List[str],
+    k: int = 3,
+    multi_label: bool = True,
+    tokenizer: Optional[AutoTokenizer] = None,
+    model: Optional[AutoModelForSequenceClassification] = None,
+    device: Optional[torch.device] = None,
+    hypothesis_template: str = "This example is about {}.",
+    batch_size: int = 16,
+    amp_dtype: Optional[str] = None,
+) -> List[List[Tuple[str, float]]]:
+    """
+    For each input text, return the top-k (label, score) pairs among candidate_labels.
+    """
+    scores, labels = zero_shot_scores(
+        texts,
+        candidate_labels=candidate_labels,
+        multi_label=multi_label,
+        tokenizer=tokenizer,
+        model=model,
+        device=device,
+        hypothesis_template=hypothesis_template,
+        batch_size=batch_size,
+        amp_dtype=amp_dtype,
+    )
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    top = np.take_along_axis(scores, order, axis=1)
+    return [
+        [(labels[j], float(v)) for j, v in zip(idx_row, val_row)]
+        for idx_row, val_row in zip(order.tolist(), top.tolist())
+    ]
 
 def zero_shot_one(
     text: str,
@@ -1,103 +1,302 @@
+"""
+Tag scores are stored in long format, one row per (message, label):
+
+  tag_label(label_id, label, column_name, created_at)        -- label registry
+  message_tag_score(channel, id, date_unix, label_id, score, created_at)
+
+With multi_label=True each label is scored independently, so adding a label
+only means scoring that one hypothesis for the backlog. `message_tag` is a
+view pivoting the scores back to one REAL column per registered label
+(column_name), which keeps the wide shape used by the export scripts.
+"""
+from typing import Dict, Sequence
+import time
+from psycopg2 import sql
 from psycopg2.extensions import connection as PGConnection
+import numpy as np
 import pandas as pd
+from news_classifier.partitions import add_months, ensure_partition, ensure_partitions_for, month_of
+from news_classifier.tag.labels import _norm
 
-def ensure_tag_table(conn: PGConnection) -> None:
+def ensure_tag_table(conn: PGConnection, table: str = "message_tag_score", messages_table: str = "messages") -> None:
+    # Partitioned by month like messages; date_unix is copied from the message
     cur = conn.cursor()
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS message_tag (
-            channel TEXT NOT NULL,
-            id BIGINT NOT NULL,
-            economics_finance_and_markets REAL NOT NULL,
-            corporate_business_industry_and_innovation REAL NOT NULL,
-            technology_ai_and_digital_platforms REAL NOT NULL,
-            geopolitics_war_security_and_international_relations REAL NOT NULL,
-            domestic_politics_elections_and_government REAL NOT NULL,
-            energy_commodities_and_environment REAL NOT NULL,
-            society_human_rights_and_public_health REAL NOT NULL,
-            sports_entertainment_and_culture REAL NOT NULL,
-            created_at BIGINT,
-            PRIMARY KEY (channel, id),
-            FOREIGN KEY (channel, id) REFERENCES messages(channel, id) ON DELETE CASCADE
+        CREATE TABLE IF NOT EXISTS tag_label (
+            label_id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE,
+            column_name TEXT NOT NULL UNIQUE,
+            created_at BIGINT
+        )
+        """
+    )
+    cur.execute(
+        sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {table} (
+                channel TEXT NOT NULL,
+                id BIGINT NOT NULL,
+                date_unix BIGINT NOT NULL,
+                label_id INTEGER NOT NULL REFERENCES tag_label(label_id),
+                score REAL NOT NULL,
+                created_at BIGINT,
+                PRIMARY KEY (channel, id, date_unix, label_id),
+                FOREIGN KEY (channel, id, date_unix) REFERENCES {messages}(channel, id, date_unix) ON DELETE CASCADE
+            ) PARTITION BY RANGE (date_unix)
+            """
+        ).format(table=sql.Identifier(table), messages=sql.Identifier(messages_table))
+    )
+    _upgrade_label_id(cur)
+    conn.commit()
+
+def _upgrade_label_id(cur) -> None:
+    # Registries created with SMALLSERIAL: the sequence could run out (see register_labels)
+    cur.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = 'tag_label' AND column_name = 'label_id'"
+    )
+    if cur.fetchone()[0] != "smallint":
+        return
+    cur.execute("ALTER TABLE tag_label ALTER COLUMN label_id DROP DEFAULT")
+    cur.execute("ALTER TABLE tag_label ALTER COLUMN label_id TYPE INTEGER")
+    cur.execute("DROP SEQUENCE IF EXISTS tag_label_label_id_seq")
+    cur.execute("ALTER TABLE tag_label ALTER COLUMN label_id ADD GENERATED ALWAYS AS IDENTITY")
+    cur.execute("SELECT COALESCE(MAX(label_id), 0) + 1 FROM tag_label")
+    cur.execute(
+        sql.SQL("ALTER TABLE tag_label ALTER COLUMN label_id RESTART WITH {}").format(sql.Literal(cur.fetchone()[0]))
+    )
+
+def get_labels(conn: PGConnection) -> pd.DataFrame:
+    """
+    Registered labels ordered by label_id: columns ['label_id', 'label', 'column_name'].
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT label_id, label, column_name FROM tag_label ORDER BY label_id")
+    return pd.DataFrame(cur.fetchall(), columns=["label_id", "label", "column_name"])
+
+def refresh_tag_view(conn: PGConnection, commit: bool = True) -> None:
+    """
+    (Re)create the wide message_tag view with one column per registered label.
+    """
+    labels = get_labels(conn)
+    cols = [
+        sql.SQL("MAX(score) FILTER (WHERE label_id = {}) AS {}").format(
+            sql.Literal(int(lid)), sql.Identifier(col)
+        )
+        for lid, col in zip(labels["label_id"], labels["column_name"])
+    ]
+    cur = conn.cursor()
+    cur.execute("DROP VIEW IF EXISTS message_tag")
+    cur.execute(
+        sql.SQL(
+            """
+            CREATE VIEW message_tag AS
+            SELECT channel, id, date_unix, {cols}, MAX(created_at) AS created_at
+            FROM message_tag_score
+            GROUP BY channel, id, date_unix
+            """
+        ).format(cols=sql.SQL(", ").join(cols) if cols else sql.SQL("NULL::REAL AS no_labels"))
+    )
+    if commit:
+        conn.commit()
+
+def register_labels(conn: PGConnection, labels: Sequence[str], commit: bool = True) -> Dict[str, int]:
+    """
+    Add labels missing from the registry (refreshing the view if any were new)
+    and return {label: label_id} for `labels`. Only missing labels are
+    inserted: an INSERT ... ON CONFLICT still consumes an identity value.
+    """
+    cur = conn.cursor()
+    known = set(get_labels(conn)["label"])
+    new = [l for l in dict.fromkeys(labels) if l not in known]
+    added = 0
+    if new:
+        cur.executemany(
+            """
+            INSERT INTO tag_label (label, column_name, created_at)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (label) DO NOTHING
+            """,
+            [(l, _norm(l), int(time.time())) for l in new],
         )
+        added = cur.rowcount
+    if commit:
+        conn.commit()
+    cur.execute("SELECT to_regclass('message_tag')")
+    if added or cur.fetchone()[0] is None:
+        refresh_tag_view(conn, commit=commit)
+    registry = get_labels(conn)
+    by_label = dict(zip(registry["label"], registry["label_id"].astype(int)))
+    return {l: by_label[l] for l in labels}
+
+def get_untagged_news(
+    conn: PGConnection,
+    label_ids: Sequence[int],
+    max_rows: int | None = None,
+    channels: Sequence[str] | None = None,
+    min_unix_time: int | None = None,
+) -> pd.DataFrame:
+    """
+    Messages lacking a score for at least one of `label_ids`. Adds a
+    'missing_label_ids' column (sorted list) so only those labels get scored.
+    """
+    if not label_ids or (channels is not None and len(channels) == 0):
+        return pd.DataFrame()
+    query = """
+    SELECT m.channel, m.id, m.date_unix, m.text, array_agg(l.label_id ORDER BY l.label_id) AS missing_label_ids
+    FROM messages m
+    JOIN tag_label l ON l.label_id = ANY(%s::int[])
+    WHERE NOT EXISTS (
+        SELECT 1 FROM message_tag_score s
+        WHERE s.channel = m.channel AND s.id = m.id AND s.date_unix = m.date_unix AND s.label_id = l.label_id
+    )
+    """
+    params: list = [list(label_ids)]
+    if channels is not None:
+        query += " AND m.channel = ANY(%s::text[])"
+        params.append(list(channels))
+    if min_unix_time is not None:
+        query += " AND m.date_unix >= %s"
+        params.append(int(min_unix_time))
+    query += " GROUP BY m.channel, m.id, m.date_unix, m.text ORDER BY m.date_unix ASC"
+    if max_rows is not None:
+        query += " LIMIT %s"
+        params.append(int(max_rows))
+    return pd.read_sql_query(query, conn, params=params)
+
+def insert_tag_scores(
+    conn: PGConnection,
+    channel: np.ndarray,
+    id: np.ndarray,
+    date_unix: np.ndarray,
+    label_id: np.ndarray,
+    score: np.ndarray,
+    created_at: int | None = None,
+) -> int:
+    """
+    Upsert long-format scores (parallel arrays, one element per (message, label)).
+    Returns number of scores written.
+    """
+    if len(score) == 0:
+        return 0
+    if created_at is None:
+        created_at = int(time.time())
+    ensure_partitions_for(conn, "message_tag_score", np.unique(date_unix).tolist())
+    cur = conn.cursor()
+    cur.execute(
         """
+        INSERT INTO message_tag_score (channel, id, date_unix, label_id, score, created_at)
+        SELECT u.*, %s FROM unnest(%s::text[], %s::bigint[], %s::bigint[], %s::int[], %s::real[]) AS u
+        ON CONFLICT (channel, id, date_unix, label_id) DO UPDATE SET
+            score = excluded.score,
+            created_at = COALESCE(excluded.created_at, message_tag_score.created_at)
+        """,
+        (
+            created_at,
+            [str(c) for c in channel],
+            np.asarray(id, dtype=np.int64).tolist(),
+            np.asarray(date_unix, dtype=np.int64).tolist(),
+            np.asarray(label_id, dtype=np.int64).tolist(),
+            np.asarray(score, dtype=np.float64).tolist(),
+        ),
     )
     conn.commit()
+    return len(score)
 
 def insert_tag_rows(conn: PGConnection, rows: pd.DataFrame) -> int:
     """
-    Insert or upsert tag rows into message_tag.
-    rows can be:
-      - a pandas DataFrame with the same columns as the table
+    Insert or upsert wide tag rows (one column per registered label, named as
+    tag_label.column_name). NaN cells mean "not scored" and are skipped.
     Returns number of rows processed.
     """
     if rows.empty:
         return 0
-        
-    # Required fields; created_at is optional and will be set to now if missing
-    required = [
-        "channel",
-        "id",
-        "economics_finance_and_markets",
-        "corporate_business_industry_and_innovation",
-        "technology_ai_and_digital_platforms",
-        "geopolitics_war_security_and_international_relations",
-        "domestic_politics_elections_and_government",
-        "energy_commodities_and_environment",
-        "society_human_rights_and_public_health",
-        "sports_entertainment_and_culture",
-    ]
+
+    required = ["channel", "id", "date_unix"]
     missing = [c for c in required if c not in rows.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
+    registry = get_labels(conn)
+    col_to_id = dict(zip(registry["column_name"], registry["label_id"].astype(int)))
+    label_cols = [c for c in rows.columns if c not in required and c != "created_at"]
+    unknown = [c for c in label_cols if c not in col_to_id]
+    if unknown:
+        raise ValueError(f"Unregistered label columns: {unknown}")
 
-    # Start with required fields
-    df = rows[required].copy()
-    # Ensure created_at exists; fill missing with current unix time (seconds)
-    import time
-    now_unix = int(time.time())
-    if "created_at" in rows.columns:
-        df["created_at"] = rows["created_at"]
-    else:
-        df["created_at"] = now_unix
-    # Coerce types; created_at may have NaNs -> fill with now
-    df["channel"] = df["channel"].astype(str)
-    df["id"] = df["id"].astype(int)
-    float_cols = required[2:]
-    for c in float_cols:
-        df[c] = df[c].astype(float)
-    df["created_at"] = df["created_at"].apply(lambda x: int(x) if pd.notna(x) else now_unix)
-
-    sql = """
-    INSERT INTO message_tag (
-        channel, id,
-        economics_finance_and_markets,
-        corporate_business_industry_and_innovation,
-        technology_ai_and_digital_platforms,
-        geopolitics_war_security_and_international_relations,
-        domestic_politics_elections_and_government,
-        energy_commodities_and_environment,
-        society_human_rights_and_public_health,
-        sports_entertainment_and_culture,
-        created_at
+    # Wide -> long without per-cell Python loops
+    values = rows[label_cols].to_numpy(dtype=np.float32)
+    r, c = np.nonzero(~np.isnan(values))
+    label_ids = np.array([col_to_id[col] for col in label_cols], dtype=np.int64)
+    insert_tag_scores(
+        conn,
+        rows["channel"].astype(str).to_numpy()[r],
+        rows["id"].to_numpy()[r],
+        rows["date_unix"].to_numpy()[r],
+        label_ids[c],
+        values[r, c],
     )
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    ON CONFLICT(channel, id) DO UPDATE SET
-        economics_finance_and_markets = excluded.economics_finance_and_markets,
-        corporate_business_industry_and_innovation = excluded.corporate_business_industry_and_innovation,
-        technology_ai_and_digital_platforms = excluded.technology_ai_and_digital_platforms,
-        geopolitics_war_security_and_international_relations = excluded.geopolitics_war_security_and_international_relations,
-        domestic_politics_elections_and_government = excluded.domestic_politics_elections_and_government,
-        energy_commodities_and_environment = excluded.energy_commodities_and_environment,
-        society_human_rights_and_public_health = excluded.society_human_rights_and_public_health,
-        sports_entertainment_and_culture = excluded.sports_entertainment_and_culture,
-        created_at = COALESCE(excluded.created_at, message_tag.created_at)
+    return len(rows)
+
+def migrate_wide_tags(conn: PGConnection, labels: Sequence[str], source: str = "message_tag") -> int:
+    """
+    Move scores from an old wide message_tag table into message_tag_score and
+    replace the table with the pivot view. The old table is kept as
+    message_tag_wide_heap. Only columns matching a label in `labels` are moved.
+    The rename, view and copy run in one transaction, so a failure leaves the
+    wide table in place for the next run. Returns number of scores copied.
     """
-    ordered_cols = required + ["created_at"]
-    data = list(df[ordered_cols].itertuples(index=False, name=None))
-    if not data:
-        return 0
     cur = conn.cursor()
-    cur.executemany(sql, data)
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s", (source,))
+    row = cur.fetchone()
+    if row is None or row[0] == "v":
+        return 0
+    ensure_tag_table(conn)
+    try:
+        n = _copy_wide_tags(conn, labels, source)
+    except Exception:
+        conn.rollback()
+        raise
     conn.commit()
-    return len(data)
\ No newline at end of file
+    return n
+
+def _copy_wide_tags(conn: PGConnection, labels: Sequence[str], source: str) -> int:
+    # Does not commit: see migrate_wide_tags
+    cur = conn.cursor()
+    cur.execute(sql.SQL("ALTER TABLE {} RENAME TO message_tag_wide_heap").format(sql.Identifier(source)))
+    label_ids = register_labels(conn, labels, commit=False)
+    cur.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = 'message_tag_wide_heap'"
+    )
+    wide_cols = {r[0] for r in cur.fetchall()}
+    pairs = [(label_ids[l], _norm(l)) for l in labels if _norm(l) in wide_cols]
+    if not pairs:
+        return 0
+    cur.execute(
+        "SELECT MIN(m.date_unix), MAX(m.date_unix) FROM message_tag_wide_heap w "
+        "JOIN messages m ON m.channel = w.channel AND m.id = w.id"
+    )
+    lo, hi = cur.fetchone()
+    if lo is None:
+        return 0
+    (y, mo), last = month_of(lo), month_of(hi)
+    while (y, mo) <= last:
+        ensure_partition(conn, "message_tag_score", y, mo)
+        y, mo = add_months(y, mo, 1)
+    values = sql.SQL(", ").join(
+        sql.SQL("({}, w.{})").format(sql.Literal(lid), sql.Identifier(col)) for lid, col in pairs
+    )
+    # date_unix comes from messages: older wide tables did not carry it
+    cur.execute(
+        sql.SQL(
+            """
+            INSERT INTO message_tag_score (channel, id, date_unix, label_id, score, created_at)
+            SELECT w.channel, w.id, m.date_unix, v.label_id, v.score, w.created_at
+            FROM message_tag_wide_heap w
+            JOIN messages m ON m.channel = w.channel AND m.id = w.id
+            CROSS JOIN LATERAL (VALUES {values}) AS v(label_id, score)
+            WHERE v.score IS NOT NULL
+            ON CONFLICT DO NOTHING
+            """
+        ).format(values=values)
+    )
+    return cur.rowcount
@@ -0,0 +1,19 @@
+"""
+Tag categories. Kept free of heavy imports so the inference service can read
+them without pulling in pandas / psycopg2.
+"""
+
+# Adding a label here only scores that label for already tagged messages
+LABELS = [
+    "economics, finance and markets",
+    "corporate, business, industry and innovation",
+    "technology, ai and digital platforms",
+    "geopolitics, war, security and international relations",
+    "domestic politics, elections and government",
+    "energy, commodities and environment",
+    "society, human rights and public health",
+    "sports, entertainment and culture",
+]
+
+def _norm(label: str) -> str:
+    return label.replace(",", "").replace(" ", "_").lower()
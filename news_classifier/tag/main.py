@@ -1,61 +1,72 @@
-from news_classifier.utils import timeit, get_db_news
+from news_classifier.utils import timeit, plan_score_reuse, apply_score_reuse
 import logging
+import numpy as np
 import pandas as pd
 import psycopg2
-from news_classifier.tag.database import ensure_tag_table, insert_tag_rows
-from news_classifier.tag.bart_large_mnli import load_model, get_device, zero_shot_top_k
+from news_classifier.tag.labels import LABELS, _norm
+from news_classifier.autotune import apply_profile
+from news_classifier.sketches import try_update_sketches
+from news_classifier.tag.database import (
+    ensure_tag_table, get_untagged_news, insert_tag_rows, migrate_wide_tags, register_labels
+)
+from news_classifier.tag.bart_large_mnli import load_model, get_device, zero_shot_scores
 
 logger = logging.getLogger(__name__)
 
-LABELS = [
-    "economics, finance and markets",
-    "corporate, business, industry and innovation",
-    "technology, ai and digital platforms",
-    "geopolitics, war, security and international relations",
-    "domestic politics, elections and government",
-    "energy, commodities and environment",
-    "society, human rights and public health",
-    "sports, entertainment and culture",
-]
-
-def _norm(label: str) -> str:
-    return label.replace(",", "").replace(" ", "_").lower()
+# Near-duplicates at least this similar to an already tagged message reuse its scores
+REUSE_MIN_SIMILARITY = 0.9
 
 @timeit
-def build_tag_dataframe(news: pd.DataFrame, amp_dtype: str | None = "bf16") -> pd.DataFrame:
+def build_tag_dataframe(
+    news: pd.DataFrame, amp_dtype: str | None = "bf16", labels: list = LABELS, pipelined: bool = True
+) -> pd.DataFrame:
     """
     Build a DataFrame with scores per label (one column per label) for each message.
-    Output columns: ['channel','id'] + normalized label columns
+    If `news` has a 'missing_labels' column (list of labels per row), only those
+    labels are scored and the other cells are NaN.
+    Output columns: ['channel','id','date_unix'] + normalized label columns
     """
     if news.empty:
         return pd.DataFrame()
-    if not {"channel", "id", "text"}.issubset(news.columns):
-        raise ValueError("Input DataFrame must have 'channel','id','text' columns")
+    if not {"channel", "id", "date_unix", "text"}.issubset(news.columns):
+        raise ValueError("Input DataFrame must have 'channel','id','date_unix','text' columns")
 
     tokenizer, model = load_model()
     device = get_device()
-    # Get all scores by setting k=len(LABELS)
-    pairs_list = zero_shot_top_k(
-        news["text"].astype(str).tolist(),
-        candidate_labels=LABELS,
-        k=len(LABELS),
-        multi_label=True,
-        tokenizer=tokenizer,
-        model=model,
-        device=device,
-        amp_dtype=amp_dtype,
-        batch_size=8,
-    )
-    # Build scores matrix
-    norm_cols = [_norm(l) for l in LABELS]
-    scores_df = pd.DataFrame(0.0, index=range(len(pairs_list)), columns=norm_cols, dtype=float)
-    for i, pairs in enumerate(pairs_list):
-        for label, score in pairs:
-            scores_df.at[i, _norm(label)] = float(score)
-    out = pd.concat([news[["channel", "id"]].reset_index(drop=True), scores_df], axis=1)
+    # Tuned batch_size / max_length / threads for this host, if autotune has run here
+    params = apply_profile("bart-large-mnli")
+    texts = news["text"].astype(str).to_numpy()
+    if "missing_labels" in news.columns:
+        groups: dict = {}
+        for pos, missing in enumerate(news["missing_labels"]):
+            groups.setdefault(tuple(missing), []).append(pos)
+    else:
+        groups = {tuple(labels): list(range(len(news)))}
+    label_index = {l: i for i, l in enumerate(labels)}
+    scores = np.full((len(news), len(labels)), np.nan, dtype=np.float32)
+    # multi_label scores are independent per label, so each group only runs its own hypotheses
+    for group_labels, pos in groups.items():
+        pos = np.asarray(pos)
+        group_scores, group_cols = zero_shot_scores(
+            texts[pos].tolist(),
+            candidate_labels=list(group_labels),
+            multi_label=True,
+            tokenizer=tokenizer,
+            model=model,
+            device=device,
+            amp_dtype=amp_dtype,
+            pipelined=pipelined,
+            **params,
+        )
+        cols = [label_index[l] for l in group_cols]
+        scores[np.ix_(pos, cols)] = group_scores
+    out = pd.DataFrame(scores, columns=[_norm(l) for l in labels])
+    out.insert(0, "date_unix", news["date_unix"].to_numpy())
+    out.insert(0, "id", news["id"].to_numpy())
+    out.insert(0, "channel", news["channel"].to_numpy())
     return out
 
-def main() -> None:
+def main(reuse_min_similarity: float | None = REUSE_MIN_SIMILARITY) -> None:
     db_dsn = "postgresql://ian@localhost:5432/telegram_news"
     conn = psycopg2.connect(db_dsn)
     ensure_tag_table(conn)
@@ -66,18 +77,47 @@ def main() -> None:
     "https://t.me/ReutersWorldChannel",
     "https://t.me/washingtonpost",
 ]
-    # Get messages without tags yet # 1st gen 2024: 1704063600 #1st may 2024: 1714521600
-    df_news = get_db_news(conn, table="message_tag", min_unix_time=1704063600, channels=channels)
+    n_moved = migrate_wide_tags(conn, LABELS)
+    if n_moved:
+        logger.info(f"Converted {n_moved} scores from the old wide message_tag table")
+    label_ids = register_labels(conn, LABELS)
+    id_to_label = {v: k for k, v in label_ids.items()}
+    # Get messages missing at least one label # 1st gen 2024: 1704063600 #1st may 2024: 1714521600
+    df_news = get_untagged_news(conn, list(label_ids.values()), min_unix_time=1704063600, channels=channels)
+    if df_news.empty:
+        conn.close()
+        logger.info("No messages to tag")
+        return
+    df_news["missing_labels"] = df_news["missing_label_ids"].map(lambda ids: [id_to_label[i] for i in ids])
+    df_news = df_news.drop(columns=["missing_label_ids"])
+    # Only untouched messages can copy a whole score row from a near-duplicate
+    is_new = df_news["missing_labels"].map(len) == len(LABELS)
+    score_cols = [_norm(l) for l in LABELS]
+    if reuse_min_similarity is not None and is_new.any():
+        df_todo, followers, rep_scores = plan_score_reuse(
+            conn, df_news[is_new], "message_tag", score_cols, reuse_min_similarity
+        )
+        df_todo = pd.concat([df_todo, df_news[~is_new]], ignore_index=True)
+    else:
+        df_todo, followers, rep_scores = df_news, pd.DataFrame(), pd.DataFrame()
     conn.close()
-    logger.info(f"Fetched {len(df_news)} news rows to tag")
-    df_tags = build_tag_dataframe(df_news)
-    logger.info(f"Built tags for {len(df_tags)} rows")
+    n_partial = int((~is_new).sum())
+    if n_partial:
+        logger.info(f"{n_partial} already tagged messages only need newly added labels")
+    logger.info(f"Fetched {len(df_news)} news rows to tag ({len(followers)} near-duplicates reuse existing scores)")
+    df_tags = build_tag_dataframe(df_todo)
+    df_tags = apply_score_reuse(df_tags, followers, rep_scores, score_cols)
+    logger.info(
+        f"Built tags for {len(df_tags)} rows, inference avoided for "
+        f"{len(df_news) - len(df_todo)}/{len(df_news)} ({100 * (len(df_news) - len(df_todo)) / max(len(df_news), 1):.1f}%)"
+    )
     if df_tags.empty:
         return
     conn = psycopg2.connect(db_dsn)
     n = insert_tag_rows(conn, df_tags)
     conn.close()
-    logger.info(f"Inserted/updated {n} tag rows")
+    logger.info(f"Inserted/updated scores for {n} tagged rows")
+    try_update_sketches(db_dsn)
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
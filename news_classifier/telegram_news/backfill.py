@@ -0,0 +1,223 @@
+"""
+Range-parallel historical backfill for a single channel.
+
+The channel history between two dates is split into id ranges that are
+fetched concurrently (bounded by --concurrency) with Telethon's
+min_id/max_id bounds. Each range keeps its own checkpoint in
+backfill_checkpoint, so an interrupted run resumes every unfinished range
+from where it stopped and the union of ranges stays gap-free. A run with
+other --since/--until than the unfinished ranges were planned for stops
+with an error; --reset drops those ranges and plans new ones.
+
+Usage:
+  python -m news_classifier.telegram_news.backfill --channel https://t.me/cnbc_tv18 \
+      --since 2024-01-01 --ranges 16 --concurrency 4
+"""
+from calendar import timegm
+from datetime import datetime, timezone
+from typing import List, Tuple
+import asyncio
+import logging
+import os
+
+import psycopg2
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from news_classifier.telegram_news.database import (
+    create_backfill_ranges,
+    delete_backfill_ranges,
+    ensure_backfill_table,
+    ensure_dedup_tables,
+    ensure_messages_table,
+    get_backfill_plans,
+    get_backfill_ranges,
+    get_closest_timestamp_id,
+    insert_rows,
+    update_backfill_cursor,
+)
+from news_classifier.telegram_news.dedup import assign_clusters, CLUSTER_THRESHOLD
+from news_classifier.telegram_news.fetch import iter_range_batches
+from news_classifier.telegram_news.keywords_filter import keyword_filter
+from news_classifier.telegram_news.main import load_env
+
+logger = logging.getLogger(__name__)
+
+
+def split_id_range(min_id: int, max_id: int, n: int) -> List[Tuple[int, int]]:
+    """
+    Split the exclusive interval (min_id, max_id) into at most n contiguous
+    exclusive intervals that together cover exactly the same ids.
+    """
+    first, end = min_id + 1, max_id  # ids first..end-1
+    total = end - first
+    if total <= 0:
+        return []
+    n = max(1, min(n, total))
+    points = [first + (total * i) // n for i in range(n)] + [end]
+    return [(points[i] - 1, points[i + 1]) for i in range(n)]
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def _to_unix(value: datetime | None) -> int | None:
+    return None if value is None else timegm(value.utctimetuple())
+
+
+async def _run_db(lock: asyncio.Lock, fn, *args):
+    # psycopg2 calls block; run them in a worker thread, one at a time on the shared connection
+    async with lock:
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def resolve_bounds(client, conn, channel: str, since: datetime | None, until: datetime | None) -> Tuple[int, int]:
+    """
+    Exclusive (min_id, max_id) bounds for messages posted in [since, until).
+    The lower bound is taken from the local DB when it already has a message
+    from before `since` (no API call), otherwise from Telegram.
+    """
+    if until is not None:
+        msgs = await client.get_messages(channel, limit=1, offset_date=until)
+    else:
+        msgs = await client.get_messages(channel, limit=1)
+    max_id = msgs[0].id + 1 if msgs else 1
+
+    min_id = 0
+    if since is not None:
+        local = get_closest_timestamp_id(conn, timegm(since.utctimetuple()), channel)
+        if local is not None:
+            min_id = local
+        else:
+            msgs = await client.get_messages(channel, limit=1, offset_date=since)
+            min_id = msgs[0].id if msgs else 0
+    return min_id, max_id
+
+
+async def backfill_range(
+    client,
+    conn,
+    channel: str,
+    min_id: int,
+    max_id: int,
+    cursor_id: int,
+    sem: asyncio.Semaphore,
+    db_lock: asyncio.Lock,
+    batch_size: int = 500,
+    dedup_threshold: float = CLUSTER_THRESHOLD,
+) -> int:
+    """
+    Fetch (min_id, cursor_id) newest first, inserting each batch and then
+    advancing the range checkpoint. DB calls run in the default executor
+    under db_lock, so other ranges keep fetching meanwhile. Returns inserted rows.
+    """
+    inserted = 0
+    async with sem:
+        while cursor_id > min_id + 1:
+            try:
+                async for rows, new_cursor in iter_range_batches(client, channel, min_id, cursor_id, batch_size):
+                    rows = keyword_filter(rows)
+                    inserted += await _run_db(db_lock, insert_rows, conn, channel, rows)
+                    await _run_db(db_lock, assign_clusters, conn, channel, [(r.id, r.text) for r in rows], dedup_threshold)
+                    # Checkpoint only after the batch is stored; replays are idempotent
+                    await _run_db(db_lock, update_backfill_cursor, conn, channel, min_id, max_id, new_cursor, len(rows))
+                    cursor_id = new_cursor
+                break
+            except FloodWaitError as e:
+                logger.info(f"[{channel}] ({min_id}, {max_id}) rate limited: waiting {e.seconds}s ...")
+                await asyncio.sleep(e.seconds)
+        await _run_db(db_lock, update_backfill_cursor, conn, channel, min_id, max_id, min_id + 1, 0, True)
+    logger.info(f"[{channel}] range ({min_id}, {max_id}) done: +{inserted} messages")
+    return inserted
+
+
+async def backfill_channel(
+    client,
+    conn,
+    channel: str,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    n_ranges: int = 8,
+    concurrency: int = 4,
+    batch_size: int = 500,
+    dedup_threshold: float = CLUSTER_THRESHOLD,
+    reset: bool = False,
+) -> int:
+    """
+    Backfill one channel. Unfinished ranges from a previous run are resumed
+    as they are; new ranges are only planned when none are pending. Raises
+    ValueError when since/until differ from the pending ranges' plan, unless
+    reset drops those ranges first.
+    """
+    since_unix, until_unix = _to_unix(since), _to_unix(until)
+    if reset:
+        n = delete_backfill_ranges(conn, channel)
+        if n:
+            logger.info(f"[{channel}] dropped {n} unfinished ranges")
+    pending = get_backfill_ranges(conn, channel)
+    if pending:
+        plans = get_backfill_plans(conn, channel)
+        if plans != [(since_unix, until_unix)]:
+            logger.warning(f"[{channel}] unfinished ranges were planned for (since, until) {plans}")
+            raise ValueError(
+                f"[{channel}] --since/--until differ from the unfinished backfill; "
+                "re-run with the original dates to resume, or pass --reset to plan new ranges"
+            )
+        logger.info(f"[{channel}] resuming {len(pending)} unfinished ranges")
+    else:
+        min_id, max_id = await resolve_bounds(client, conn, channel, since, until)
+        bounds = split_id_range(min_id, max_id, n_ranges)
+        create_backfill_ranges(conn, channel, bounds, since_unix, until_unix)
+        pending = get_backfill_ranges(conn, channel)
+        logger.info(f"[{channel}] planned {len(bounds)} ranges over ids ({min_id}, {max_id})")
+
+    sem = asyncio.Semaphore(concurrency)
+    db_lock = asyncio.Lock()
+    results = await asyncio.gather(*[
+        backfill_range(client, conn, channel, lo, hi, cursor, sem, db_lock, batch_size, dedup_threshold)
+        for lo, hi, cursor, _, _ in pending
+    ])
+    return sum(results)
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channel", required=True)
+    parser.add_argument("--since", default=None, help="YYYY-MM-DD (UTC), default: channel start")
+    parser.add_argument("--until", default=None, help="YYYY-MM-DD (UTC), default: now")
+    parser.add_argument("--ranges", type=int, default=8, help="Number of id ranges to split history into")
+    parser.add_argument("--concurrency", type=int, default=4, help="Ranges fetched at the same time")
+    parser.add_argument("--batch-size", type=int, default=500, help="Messages per insert/checkpoint")
+    parser.add_argument("--dedup-threshold", type=float, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--reset", action="store_true",
+                        help="Drop unfinished ranges of a previous run and plan new ones")
+    args = parser.parse_args()
+
+    api_id, api_hash, phone, session_name = load_env()
+    conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+    ensure_messages_table(conn)
+    ensure_dedup_tables(conn)
+    ensure_backfill_table(conn)
+
+    client = TelegramClient(os.path.join(os.path.dirname(__file__), session_name), api_id, api_hash)
+    client = client.start(phone=phone) if phone else client.start()
+    since = _parse_date(args.since) if args.since else None
+    until = _parse_date(args.until) if args.until else None
+    with client:
+        n = client.loop.run_until_complete(backfill_channel(
+            client, conn, args.channel, since, until,
+            n_ranges=args.ranges,
+            concurrency=args.concurrency,
+            batch_size=args.batch_size,
+            dedup_threshold=args.dedup_threshold,
+            reset=args.reset,
+        ))
+    conn.close()
+    logger.info(f"[{args.channel}] backfill inserted {n} messages")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
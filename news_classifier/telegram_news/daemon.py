@@ -0,0 +1,276 @@
+"""
+Continuous ingestion from Telegram update streams.
+
+Instead of polling every channel, the daemon subscribes to new-message
+updates for the channels in channels.txt. Incoming messages are sanitized
+on arrival and written in small batches (every --batch-size messages or
+--flush-interval seconds, whichever comes first) through the same
+keyword filter / insert / near-duplicate path as main.ingest_channels.
+
+Updates can be lost while the client is disconnected, so a gap-fill sweep
+fetches each channel from its watermark (ingest_watermark.swept_id, or
+get_last_saved_id the first time) at startup, after every automatic
+reconnect and every --sweep-interval seconds. Inserts are idempotent, so
+messages that arrive through both paths are stored once.
+
+DB writes are blocking psycopg2 calls; they run in a worker thread, one at a
+time, so a long sweep does not stall update handling or Telethon's keepalives.
+
+Usage:
+  python -m news_classifier.telegram_news.daemon --channels news_classifier/telegram_news/channels.txt
+"""
+from typing import Dict, List, Tuple
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import psycopg2
+from telethon import TelegramClient, events
+from telethon.errors import ChannelPrivateError, FloodWaitError, UsernameInvalidError
+from telethon.utils import get_peer_id
+
+from news_classifier.telegram_news.database import (
+    ensure_dedup_tables,
+    ensure_messages_table,
+    ensure_watermark_table,
+    get_last_saved_id,
+    get_watermark,
+    set_watermark,
+)
+from news_classifier.telegram_news.dedup import CLUSTER_THRESHOLD
+from news_classifier.telegram_news.fetch import fetch_new_rows, keep_text, message_to_row
+from news_classifier.telegram_news.main import load_env, read_channels, store_rows
+from news_classifier.telegram_news.records import MessageRecord
+
+logger = logging.getLogger(__name__)
+
+
+class ReconnectAwareClient(TelegramClient):
+    """
+    TelegramClient that calls `on_reconnect` after each automatic reconnect
+    (Telethon runs _handle_auto_reconnect once the connection is back).
+    That method is private, so telethon is pinned to 1.x in requirements.txt.
+    """
+
+    on_reconnect = None
+
+    async def _handle_auto_reconnect(self):
+        await super()._handle_auto_reconnect()
+        if self.on_reconnect is not None:
+            self.on_reconnect()
+
+
+class IngestDaemon:
+    """
+    Update handler, batch writer and gap-fill sweeper sharing one client and
+    one DB connection. DB work runs in the default executor under db_lock, so
+    writes never interleave and never block the event loop.
+    """
+
+    def __init__(
+        self,
+        client,
+        conn,
+        channels: List[str],
+        batch_size: int = 50,
+        flush_interval: float = 2.0,
+        sweep_interval: float = 300.0,
+        dedup_threshold: float = CLUSTER_THRESHOLD,
+    ):
+        self.client = client
+        self.conn = conn
+        self.channels = channels
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.dedup_threshold = dedup_threshold
+        self.queue: asyncio.Queue[Tuple[str, MessageRecord]] = asyncio.Queue()
+        self.names: Dict[int, str] = {}
+        self.watermarks: Dict[str, int] = {}
+        self.db_lock = asyncio.Lock()
+        self.reconnected = asyncio.Event()
+
+    def notify_reconnect(self) -> None:
+        self.reconnected.set()
+
+    async def _run_db(self, fn, *args):
+        async with self.db_lock:
+            return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def resolve(self) -> List:
+        """
+        Resolve channels to entities for the update filter. Channels that
+        cannot be resolved are dropped with a warning, like in the poller.
+        """
+        entities = []
+        for ch in self.channels:
+            try:
+                entity = await self.client.get_entity(ch)
+            except (ChannelPrivateError, UsernameInvalidError, ValueError) as e:
+                logger.warning(f"[{ch}] skipped: {e.__class__.__name__}: {e}")
+                continue
+            self.names[get_peer_id(entity)] = ch
+            entities.append(entity)
+            stored = await self._run_db(get_watermark, self.conn, ch)
+            if stored is None:
+                stored = await self._run_db(get_last_saved_id, self.conn, ch) or 0
+            self.watermarks[ch] = stored
+        self.channels = list(self.names.values())
+        return entities
+
+    async def on_new_message(self, event) -> None:
+        ch = self.names.get(event.chat_id)
+        if ch is None:
+            return
+        msg = event.message
+        await msg.get_sender()
+        row = message_to_row(msg)
+        if keep_text(row.text):
+            self.queue.put_nowait((ch, row))
+
+    async def flush(self, pending: List[Tuple[str, MessageRecord]]) -> None:
+        by_channel: Dict[str, List[MessageRecord]] = {}
+        for ch, row in pending:
+            by_channel.setdefault(ch, []).append(row)
+        for ch, rows in by_channel.items():
+            try:
+                kept, inserted, near_dups = await self._run_db(store_rows, self.conn, ch, rows, self.dedup_threshold)
+                logger.info(f"[{ch}] live: +{inserted} inserted (received {len(rows)}, passed keyword filter {kept}, near-duplicates {near_dups})")
+            except Exception as e:
+                # The next sweep picks these up again
+                await self._run_db(self.conn.rollback)
+                logger.error(f"[{ch}] live batch of {len(rows)} failed: {e}")
+
+    async def writer(self) -> None:
+        """
+        Drain the update queue in batches of at most batch_size messages,
+        waiting at most flush_interval after the first one.
+        """
+        while True:
+            pending = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(pending) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self.flush(pending)
+
+    async def sweep(self) -> Dict[str, int]:
+        """
+        Fetch every channel from its watermark, store what the update stream
+        missed, and advance the watermark to the newest id fetched.
+        Returns totals: {'fetched', 'kept', 'inserted'}.
+        """
+        totals = {"fetched": 0, "kept": 0, "inserted": 0}
+        for ch in self.channels:
+            try:
+                rows = await fetch_new_rows(self.client, ch, min_id=self.watermarks[ch])
+                kept, inserted, near_dups = await self._run_db(store_rows, self.conn, ch, rows, self.dedup_threshold)
+                if rows:
+                    self.watermarks[ch] = max(self.watermarks[ch], max(r.id for r in rows))
+                    await self._run_db(set_watermark, self.conn, ch, self.watermarks[ch])
+                totals["fetched"] += len(rows)
+                totals["kept"] += kept
+                totals["inserted"] += inserted
+                if inserted:
+                    logger.info(f"[{ch}] sweep: +{inserted} inserted (fetched {len(rows)}, passed keyword filter {kept}, near-duplicates {near_dups})")
+            except FloodWaitError as e:
+                logger.info(f"[{ch}] rate limited: waiting {e.seconds}s ...")
+                await asyncio.sleep(e.seconds)
+            except (ChannelPrivateError, UsernameInvalidError) as e:
+                logger.warning(f"[{ch}] skipped: {e.__class__.__name__}: {e}")
+            except Exception as e:
+                await self._run_db(self.conn.rollback)
+                logger.error(f"[{ch}] sweep error: {e}")
+        return totals
+
+    async def sweeper(self) -> None:
+        """
+        Sweep every sweep_interval seconds and right after each reconnect
+        (notify_reconnect), however short the disconnect was.
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.reconnected.wait(), self.sweep_interval)
+                logger.info("Reconnected: running gap-fill sweep")
+            except asyncio.TimeoutError:
+                pass
+            self.reconnected.clear()
+            if not self.client.is_connected():
+                # The reconnect callback triggers the sweep once it is back
+                continue
+            totals = await self.sweep()
+            logger.info(f"Sweep: fetched {totals['fetched']}, inserted {totals['inserted']}")
+
+    async def run(self) -> None:
+        entities = await self.resolve()
+        if not entities:
+            raise ValueError("None of the configured channels could be resolved")
+        self.client.add_event_handler(self.on_new_message, events.NewMessage(chats=entities))
+        totals = await self.sweep()
+        logger.info(f"Initial sweep: fetched {totals['fetched']}, inserted {totals['inserted']}; listening on {len(entities)} channels")
+        tasks = [asyncio.create_task(self.writer()), asyncio.create_task(self.sweeper())]
+        try:
+            await self.client.run_until_disconnected()
+        finally:
+            for task in tasks:
+                task.cancel()
+            pending = []
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+            if pending:
+                await self.flush(pending)
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channels", default=os.path.join(os.path.dirname(__file__), "channels.txt"))
+    parser.add_argument("--batch-size", type=int, default=50, help="Max messages per live insert")
+    parser.add_argument("--flush-interval", type=float, default=2.0, help="Max seconds a live message waits before insert")
+    parser.add_argument("--sweep-interval", type=float, default=300.0, help="Seconds between gap-fill sweeps")
+    parser.add_argument("--dedup-threshold", type=float, default=CLUSTER_THRESHOLD,
+                        help="Min MinHash similarity to join an existing near-duplicate cluster")
+    args = parser.parse_args()
+
+    api_id, api_hash, phone, session_name = load_env()
+    conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+    ensure_messages_table(conn)
+    ensure_dedup_tables(conn)
+    ensure_watermark_table(conn)
+
+    channels = read_channels(args.channels)
+    if not channels:
+        print("No channels found in channels.txt", file=sys.stderr)
+        sys.exit(1)
+
+    # catch_up replays updates Telegram kept for us while the daemon was offline
+    client = ReconnectAwareClient(os.path.join(os.path.dirname(__file__), session_name), api_id, api_hash, catch_up=True)
+    client = client.start(phone=phone) if phone else client.start()
+    daemon = IngestDaemon(
+        client,
+        conn,
+        channels,
+        batch_size=args.batch_size,
+        flush_interval=args.flush_interval,
+        sweep_interval=args.sweep_interval,
+        dedup_threshold=args.dedup_threshold,
+    )
+    client.on_reconnect = daemon.notify_reconnect
+    with client:
+        try:
+            client.loop.run_until_complete(daemon.run())
+        except KeyboardInterrupt:
+            logger.info("Stopping")
+    conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
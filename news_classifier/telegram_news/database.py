@@ -1,31 +1,45 @@
 """
 Database schema/helpers for Telegram news (PostgreSQL).
 
-date_unix is the UTC unix timestamp of the message.
+date_unix is the UTC unix timestamp of the message. `messages` is range
+partitioned by month on date_unix (see news_classifier.partitions), so
+date_unix is part of the primary key and must be set.
 """
-from typing import List
+from typing import List, Sequence, Tuple
+import logging
+import psycopg2
+from psycopg2 import sql
 from psycopg2.extensions import connection as PGConnection
 
+from news_classifier.partitions import ensure_partitions_for
+from news_classifier.telegram_news.records import MessageBatch, MessageRecord
 
-def ensure_messages_table(conn: PGConnection) -> None:
+logger = logging.getLogger(__name__)
+
+
+def ensure_messages_table(conn: PGConnection, table: str = "messages") -> None:
     cur = conn.cursor()
     cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS messages (
-            channel TEXT NOT NULL,
-            id BIGINT NOT NULL,
-            date_unix BIGINT,
-            sender_id TEXT,
-            sender TEXT,
-            views BIGINT,
-            forwards BIGINT,
-            replies BIGINT,
-            text TEXT,
-            PRIMARY KEY (channel, id)
-        )
-        """
+        sql.SQL(
+            """
+            CREATE TABLE IF NOT EXISTS {table} (
+                channel TEXT NOT NULL,
+                id BIGINT NOT NULL,
+                date_unix BIGINT NOT NULL,
+                sender_id TEXT,
+                sender TEXT,
+                views BIGINT,
+                forwards BIGINT,
+                replies BIGINT,
+                text TEXT,
+                PRIMARY KEY (channel, id, date_unix)
+            ) PARTITION BY RANGE (date_unix)
+            """
+        ).format(table=sql.Identifier(table))
     )
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_messages_date ON messages(date_unix)")
+    cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {}(date_unix)").format(
+        sql.Identifier(f"idx_{table}_date"), sql.Identifier(table)
+    ))
     conn.commit()
 
 
@@ -37,46 +51,317 @@ def get_last_saved_id(conn: PGConnection, channel: str) -> int | None:
         return None
     return int(row[0])
 
-def get_closest_timestamp_id(conn: PGConnection, timestamp: int) -> int | None:
+def get_closest_timestamp_id(conn: PGConnection, timestamp: int, channel: str | None = None) -> int | None:
+    """
+    Id of the latest saved message posted at or before `timestamp`
+    (optionally within one channel).
+    """
     cur = conn.cursor()
-    cur.execute(
-        "SELECT id FROM messages WHERE date_unix <= %s ORDER BY date_unix ASC LIMIT 1",
-        (timestamp,),
-    )
+    if channel is None:
+        cur.execute(
+            "SELECT id FROM messages WHERE date_unix <= %s ORDER BY date_unix DESC LIMIT 1",
+            (timestamp,),
+        )
+    else:
+        cur.execute(
+            "SELECT id FROM messages WHERE channel = %s AND date_unix <= %s ORDER BY date_unix DESC LIMIT 1",
+            (channel, timestamp),
+        )
     row = cur.fetchone()
     if row is None:
         return None
     return int(row[0])
 
-def insert_rows(conn: PGConnection, channel: str, rows: List[List[str]]) -> int:
+def insert_rows(conn: PGConnection, channel: str, rows: Sequence[MessageRecord]) -> int:
+    """
+    Bulk insert message records, skipping (channel, id, date_unix) keys
+    already stored. The key includes the partition column, so (channel, id)
+    is checked here: a record whose id is already stored (or repeated in the
+    batch) with another date is rejected with a warning. Records without a
+    date cannot be placed in a partition and are skipped. Rows are sent
+    column-wise in a single statement. Returns inserted rows.
+    """
+    dated = [r for r in rows if r.date_unix is not None]
+    if len(dated) < len(rows):
+        logger.warning(f"[{channel}] skipped {len(rows) - len(dated)} records without a date")
+    if not dated:
+        return 0
+
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, date_unix FROM messages WHERE channel = %s AND id = ANY(%s::bigint[])",
+        (channel, list({int(r.id) for r in dated})),
+    )
+    date_of = {int(i): int(d) for i, d in cur.fetchall()}
+    rows = []
+    for r in dated:
+        if date_of.setdefault(int(r.id), int(r.date_unix)) == int(r.date_unix):
+            rows.append(r)
+    if len(rows) < len(dated):
+        logger.warning(f"[{channel}] rejected {len(dated) - len(rows)} records whose id is stored with another date")
     if not rows:
         return 0
 
-    payload = [
+    batch = MessageBatch.from_records(rows)
+    ensure_partitions_for(conn, "messages", set(batch.date_unix))
+    cur.execute(
+        """
+        INSERT INTO messages
+        (channel, id, date_unix, sender_id, sender, views, forwards, replies, text)
+        SELECT %s, * FROM unnest(
+            %s::bigint[], %s::bigint[], %s::text[], %s::text[],
+            %s::bigint[], %s::bigint[], %s::bigint[], %s::text[]
+        )
+        ON CONFLICT (channel, id, date_unix) DO NOTHING
+        """,
         (
-            channel,                        # channel (table PK part 1)
-            int(r[0]) if r[0] else None,    # id (table PK part 2) - Telegram message id
-            int(r[1]) if r[1] else None,    # date_unix (UTC seconds since epoch)
-            r[2],                           # sender_id (Telegram internal sender id)
-            r[3],                           # sender (username or first_name)
-            int(r[4]) if r[4] else None,    # views count
-            int(r[5]) if r[5] else None,    # forwards count
-            int(r[6]) if r[6] else None,    # replies count
-            r[7],                           # text (sanitized message body)
+            channel,
+            list(batch.id),
+            list(batch.date_unix),
+            [None if s is None else str(s) for s in batch.sender_id],
+            list(batch.sender),
+            list(batch.views),
+            list(batch.forwards),
+            list(batch.replies),
+            list(batch.text),
+        ),
+    )
+    conn.commit()
+    return cur.rowcount
+
+def ensure_dedup_tables(conn: PGConnection) -> None:
+    """
+    MinHash signature + cluster assignment per message, and the LSH band buckets
+    used to find near-duplicate candidates. There is no FK to the partitioned
+    messages table; detaching a partition cleans these rows up instead.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_minhash (
+            channel TEXT NOT NULL,
+            id BIGINT NOT NULL,
+            signature BYTEA NOT NULL,
+            cluster_channel TEXT NOT NULL,
+            cluster_id BIGINT NOT NULL,
+            similarity REAL NOT NULL,
+            PRIMARY KEY (channel, id)
+        )
+        """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_lsh_bucket (
+            band SMALLINT NOT NULL,
+            bucket BIGINT NOT NULL,
+            channel TEXT NOT NULL,
+            id BIGINT NOT NULL,
+            PRIMARY KEY (band, bucket, channel, id)
         )
-        for r in rows
-    ]
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_message_minhash_cluster ON message_minhash(cluster_channel, cluster_id)"
+    )
+    conn.commit()
+
+def get_indexed_ids(conn: PGConnection, channel: str, ids: List[int]) -> set:
     cur = conn.cursor()
-    cur.executemany(
+    cur.execute(
+        "SELECT id FROM message_minhash WHERE channel = %s AND id = ANY(%s::bigint[])",
+        (channel, list(ids)),
+    )
+    return {int(r[0]) for r in cur.fetchall()}
+
+def get_lsh_candidates(conn: PGConnection, keys: List[Tuple[int, int]]) -> List[tuple]:
+    """
+    Stored messages in any of the given (band, bucket) keys, looked up for a
+    whole batch at once. Returns one row per matched key:
+    (band, bucket, channel, id, signature, cluster_channel, cluster_id, cluster_signature).
+    """
+    if not keys:
+        return []
+    cur = conn.cursor()
+    cur.execute(
         """
-        INSERT INTO messages
-        (channel, id, date_unix, sender_id, sender, views, forwards, replies, text)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        SELECT b.band, b.bucket, m.channel, m.id, m.signature, m.cluster_channel, m.cluster_id, r.signature
+        FROM message_lsh_bucket b
+        JOIN (
+            SELECT DISTINCT * FROM unnest(%s::smallint[], %s::bigint[])
+        ) AS q(band, bucket) ON b.band = q.band AND b.bucket = q.bucket
+        JOIN message_minhash m ON m.channel = b.channel AND m.id = b.id
+        JOIN message_minhash r ON r.channel = m.cluster_channel AND r.id = m.cluster_id
+        """,
+        ([k[0] for k in keys], [k[1] for k in keys]),
+    )
+    return cur.fetchall()
+
+def insert_minhash(
+    conn: PGConnection,
+    channel: str,
+    msg_id: int,
+    signature: bytes,
+    buckets: List[int],
+    cluster: tuple,
+    similarity: float,
+) -> None:
+    """
+    Store one message's signature, cluster assignment and band buckets.
+    Does not commit, so a batch can be indexed in one transaction.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO message_minhash (channel, id, signature, cluster_channel, cluster_id, similarity)
+        VALUES (%s, %s, %s, %s, %s, %s)
         ON CONFLICT (channel, id) DO NOTHING
         """,
-        payload,
+        (channel, msg_id, psycopg2.Binary(signature), cluster[0], cluster[1], similarity),
+    )
+    cur.executemany(
+        """
+        INSERT INTO message_lsh_bucket (band, bucket, channel, id)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT DO NOTHING
+        """,
+        [(band, bucket, channel, msg_id) for band, bucket in enumerate(buckets)],
+    )
+
+def ensure_backfill_table(conn: PGConnection) -> None:
+    """
+    One row per backfill id range (min_id, max_id), both exclusive like
+    Telethon's bounds. `cursor_id` is the exclusive upper bound still to fetch:
+    everything in (cursor_id, max_id) is already stored. since_unix/until_unix
+    are the dates the range was planned for (NULL: not given).
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS backfill_checkpoint (
+            channel TEXT NOT NULL,
+            min_id BIGINT NOT NULL,
+            max_id BIGINT NOT NULL,
+            cursor_id BIGINT NOT NULL,
+            fetched BIGINT NOT NULL DEFAULT 0,
+            done BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_at BIGINT,
+            since_unix BIGINT,
+            until_unix BIGINT,
+            PRIMARY KEY (channel, min_id, max_id)
+        )
+        """
     )
+    cur.execute("ALTER TABLE backfill_checkpoint ADD COLUMN IF NOT EXISTS since_unix BIGINT")
+    cur.execute("ALTER TABLE backfill_checkpoint ADD COLUMN IF NOT EXISTS until_unix BIGINT")
+    conn.commit()
+
+def get_backfill_ranges(conn: PGConnection, channel: str, pending_only: bool = True) -> List[tuple]:
+    """
+    Returns (min_id, max_id, cursor_id, fetched, done) rows for a channel.
+    """
+    cur = conn.cursor()
+    sql = "SELECT min_id, max_id, cursor_id, fetched, done FROM backfill_checkpoint WHERE channel = %s"
+    if pending_only:
+        sql += " AND NOT done"
+    cur.execute(sql + " ORDER BY max_id DESC", (channel,))
+    return cur.fetchall()
+
+def get_backfill_plans(conn: PGConnection, channel: str) -> List[tuple]:
+    """
+    Distinct (since_unix, until_unix) the channel's unfinished ranges were planned for.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT DISTINCT since_unix, until_unix FROM backfill_checkpoint WHERE channel = %s AND NOT done",
+        (channel,),
+    )
+    return cur.fetchall()
+
+def create_backfill_ranges(
+    conn: PGConnection,
+    channel: str,
+    bounds: List[tuple],
+    since_unix: int | None = None,
+    until_unix: int | None = None,
+) -> None:
+    cur = conn.cursor()
+    cur.executemany(
+        """
+        INSERT INTO backfill_checkpoint (channel, min_id, max_id, cursor_id, updated_at, since_unix, until_unix)
+        VALUES (%s, %s, %s, %s, EXTRACT(EPOCH FROM now())::BIGINT, %s, %s)
+        ON CONFLICT (channel, min_id, max_id) DO NOTHING
+        """,
+        [(channel, lo, hi, hi, since_unix, until_unix) for lo, hi in bounds],
+    )
+    conn.commit()
+
+def delete_backfill_ranges(conn: PGConnection, channel: str) -> int:
+    """
+    Drop a channel's unfinished ranges. Returns deleted rows.
+    """
+    cur = conn.cursor()
+    cur.execute("DELETE FROM backfill_checkpoint WHERE channel = %s AND NOT done", (channel,))
     conn.commit()
     return cur.rowcount
 
+def update_backfill_cursor(
+    conn: PGConnection,
+    channel: str,
+    min_id: int,
+    max_id: int,
+    cursor_id: int,
+    fetched: int,
+    done: bool = False,
+) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        UPDATE backfill_checkpoint
+        SET cursor_id = %s, fetched = fetched + %s, done = %s,
+            updated_at = EXTRACT(EPOCH FROM now())::BIGINT
+        WHERE channel = %s AND min_id = %s AND max_id = %s
+        """,
+        (cursor_id, fetched, done, channel, min_id, max_id),
+    )
+    conn.commit()
+
+def ensure_watermark_table(conn: PGConnection) -> None:
+    """
+    Per-channel id up to which the ingestion daemon's gap-fill sweep has
+    fetched everything. Live updates may store newer ids before older ones
+    arrive, so MAX(id) in messages is not a safe resume point once the daemon
+    has run; the next sweep starts from `swept_id` instead.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ingest_watermark (
+            channel TEXT PRIMARY KEY,
+            swept_id BIGINT NOT NULL,
+            updated_at BIGINT
+        )
+        """
+    )
+    conn.commit()
+
+def get_watermark(conn: PGConnection, channel: str) -> int | None:
+    cur = conn.cursor()
+    cur.execute("SELECT swept_id FROM ingest_watermark WHERE channel = %s", (channel,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return int(row[0])
 
+def set_watermark(conn: PGConnection, channel: str, swept_id: int) -> None:
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO ingest_watermark (channel, swept_id, updated_at)
+        VALUES (%s, %s, EXTRACT(EPOCH FROM now())::BIGINT)
+        ON CONFLICT (channel) DO UPDATE
+        SET swept_id = GREATEST(ingest_watermark.swept_id, EXCLUDED.swept_id),
+            updated_at = EXCLUDED.updated_at
+        """,
+        (channel, swept_id),
+    )
+    conn.commit()
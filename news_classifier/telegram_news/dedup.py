@@ -0,0 +1,248 @@
+"""
+Near-duplicate detection (MinHash + LSH) over sanitized message text.
+
+Each message gets a MinHash signature of its word shingles. The signature is
+split into bands; messages sharing any band bucket are candidates and their
+estimated Jaccard similarity (fraction of equal signature slots) decides
+whether they join the same cluster. The cluster representative is the first
+message indexed in that cluster, so scorers can copy its scores instead of
+running inference again (see news_classifier.utils.plan_score_reuse).
+"""
+from typing import Dict, List, Set, Tuple
+import hashlib
+import logging
+import re
+
+import numpy as np
+import psycopg2
+from psycopg2.extensions import connection as PGConnection
+
+from news_classifier.telegram_news.database import (
+    ensure_dedup_tables,
+    get_indexed_ids,
+    get_lsh_candidates,
+    insert_minhash,
+)
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+BANDS = 32          # BANDS * ROWS must equal NUM_PERM; candidate threshold ~ (1/BANDS)^(1/ROWS)
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+CLUSTER_THRESHOLD = 0.8  # min estimated Jaccard to join an existing cluster
+
+_PRIME = np.uint64((1 << 31) - 1)
+_rng = np.random.RandomState(1)
+# Fixed seed: signatures must be stable across processes and runs
+_PERM_A = _rng.randint(1, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+_PERM_B = _rng.randint(0, (1 << 31) - 1, size=NUM_PERM).astype(np.uint64)
+
+_URL_RE = re.compile(r"https?://\S+|t\.me/\S+")
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """
+    Word shingles of the lowercased text, with links removed.
+    Texts shorter than `size` words yield a single shingle.
+    """
+    tokens = _TOKEN_RE.findall(_URL_RE.sub(" ", text.lower()))
+    if not tokens:
+        return []
+    if len(tokens) < size:
+        return [" ".join(tokens)]
+    return [" ".join(tokens[i : i + size]) for i in range(len(tokens) - size + 1)]
+
+
+def minhash(text: str) -> np.ndarray:
+    """
+    MinHash signature (uint32, length NUM_PERM) of the text's shingles.
+    A text without shingles (empty, or only links and emoji) gets an all-max
+    signature; every such text has the same one, so assign_clusters does not
+    put them in LSH buckets.
+    """
+    return minhash_shingles(shingles(text))
+
+
+def minhash_shingles(sh: List[str]) -> np.ndarray:
+    """
+    minhash() of already computed shingles.
+    """
+    if not sh:
+        return np.full(NUM_PERM, (1 << 31) - 1, dtype=np.uint32)
+    h = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in sh),
+        dtype=np.uint64,
+        count=len(sh),
+    )
+    # (a*h + b) mod p fits in uint64 since a, b < 2^31 and h < 2^32
+    perm = (h[:, None] * _PERM_A[None, :] + _PERM_B[None, :]) % _PRIME
+    return perm.min(axis=0).astype(np.uint32)
+
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """
+    One bucket hash (signed 64-bit, for BIGINT storage) per LSH band.
+    """
+    out: List[int] = []
+    for b in range(BANDS):
+        chunk = signature[b * ROWS : (b + 1) * ROWS].tobytes()
+        out.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True))
+    return out
+
+
+def similarity(sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity between two signatures.
+    """
+    return float(np.mean(sig_a == sig_b))
+
+
+def signature_to_bytes(signature: np.ndarray) -> bytes:
+    return signature.astype("<u4").tobytes()
+
+
+def signature_from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(bytes(data), dtype="<u4")
+
+
+def assign_clusters(
+    conn: PGConnection,
+    channel: str,
+    rows: List[Tuple[int, str]],
+    threshold: float = CLUSTER_THRESHOLD,
+) -> Tuple[int, int]:
+    """
+    Index (id, sanitized_text) rows of a channel and assign each to a cluster:
+    the cluster of its most similar LSH candidate if that similarity reaches
+    `threshold`, otherwise a new cluster represented by the message itself.
+    Rows must already exist in `messages`. Already indexed rows are skipped.
+    Texts without shingles always get their own cluster and no LSH buckets,
+    so they never share scores.
+    Returns (indexed, joined_existing_cluster).
+    """
+    if not rows:
+        return 0, 0
+    done = get_indexed_ids(conn, channel, [r[0] for r in rows])
+    indexed = joined = 0
+    pending: List[Tuple[int, np.ndarray, List[int]]] = []
+    for msg_id, text in rows:
+        if msg_id in done:
+            continue
+        done.add(msg_id)
+        sh = shingles(text)
+        sig = minhash_shingles(sh)
+        if not sh:
+            insert_minhash(conn, channel, msg_id, signature_to_bytes(sig), [], (channel, msg_id), 1.0)
+            indexed += 1
+            continue
+        pending.append((msg_id, sig, band_buckets(sig)))
+
+    # One lookup for the band buckets of the whole batch
+    members: Dict[Tuple[int, int], Set[Tuple[str, int]]] = {}
+    known: Dict[Tuple[str, int], Tuple[np.ndarray, Tuple[str, int], np.ndarray]] = {}
+    keys = [(band, bucket) for _, _, buckets in pending for band, bucket in enumerate(buckets)]
+    for band, bucket, c_ch, c_id, c_sig, r_ch, r_id, r_sig in get_lsh_candidates(conn, keys):
+        known[(c_ch, int(c_id))] = (signature_from_bytes(c_sig), (r_ch, int(r_id)), signature_from_bytes(r_sig))
+        members.setdefault((int(band), int(bucket)), set()).add((c_ch, int(c_id)))
+
+    for msg_id, sig, buckets in pending:
+        candidates = set().union(*(members.get(key, ()) for key in enumerate(buckets)))
+        best = None
+        for key in sorted(candidates):
+            c_sig, rep, r_sig = known[key]
+            sim = similarity(sig, c_sig)
+            if best is None or sim > best[0]:
+                best = (sim, rep, r_sig)
+        if best is not None and best[0] >= threshold:
+            cluster, rep_sig = best[1], best[2]
+            # Reuse is decided on the similarity to the representative, not the candidate
+            rep_sim = similarity(sig, rep_sig)
+            joined += 1
+        else:
+            cluster, rep_sig, rep_sim = (channel, msg_id), sig, 1.0
+        insert_minhash(conn, channel, msg_id, signature_to_bytes(sig), buckets, cluster, rep_sim)
+        # Later rows of the batch can match this one, as if it had been looked up from the DB
+        known[(channel, msg_id)] = (sig, cluster, rep_sig)
+        for key in enumerate(buckets):
+            members.setdefault(key, set()).add((channel, msg_id))
+        indexed += 1
+    conn.commit()
+    return indexed, joined
+
+
+def backfill(conn: PGConnection, threshold: float = CLUSTER_THRESHOLD, batch_size: int = 5000) -> int:
+    """
+    Index messages that have no signature yet, oldest first.
+    """
+    total = 0
+    while True:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT m.channel, m.id, m.text
+            FROM messages m
+            LEFT JOIN message_minhash h ON h.channel = m.channel AND h.id = m.id
+            WHERE h.channel IS NULL
+            ORDER BY m.date_unix ASC
+            LIMIT %s
+            """,
+            (batch_size,),
+        )
+        batch = cur.fetchall()
+        if not batch:
+            return total
+        by_channel: dict = {}
+        for ch, mid, text in batch:
+            by_channel.setdefault(ch, []).append((int(mid), text or ""))
+        for ch, rows in by_channel.items():
+            n, joined = assign_clusters(conn, ch, rows, threshold)
+            total += n
+            logger.info(f"[{ch}] indexed {n} messages ({joined} near-duplicates)")
+
+
+def report(conn: PGConnection, min_similarity: float = CLUSTER_THRESHOLD) -> dict:
+    """
+    How many indexed messages are near-duplicates of their cluster
+    representative, i.e. how much inference the scorers can skip.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT
+            COUNT(*),
+            COUNT(DISTINCT (cluster_channel, cluster_id)),
+            COUNT(*) FILTER (
+                WHERE (channel, id) <> (cluster_channel, cluster_id) AND similarity >= %s
+            )
+        FROM message_minhash
+        """,
+        (min_similarity,),
+    )
+    indexed, clusters, duplicates = cur.fetchone()
+    return {
+        "indexed": int(indexed),
+        "clusters": int(clusters),
+        "near_duplicates": int(duplicates),
+        "avoidable_fraction": (duplicates / indexed) if indexed else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=CLUSTER_THRESHOLD)
+    parser.add_argument("--backfill", action="store_true", help="Index messages without a signature")
+    args = parser.parse_args()
+    conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
+    ensure_dedup_tables(conn)
+    if args.backfill:
+        logger.info(f"Indexed {backfill(conn, args.threshold)} messages")
+    r = report(conn, args.threshold)
+    conn.close()
+    print(
+        f"indexed={r['indexed']} clusters={r['clusters']} near_duplicates={r['near_duplicates']} "
+        f"inference avoidable: {100 * r['avoidable_fraction']:.1f}%"
+    )
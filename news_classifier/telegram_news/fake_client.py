@@ -0,0 +1,210 @@
+"""
+Offline stand-in for the parts of TelegramClient the ingestion path uses.
+
+FakeTelegramClient serves synthetic channels through iter_messages /
+get_messages with Telethon's id and date bounds, and can inject
+FloodWaitError. Messages are generated deterministically from (seed, id), so
+a channel of millions of messages costs no memory until it is iterated.
+"""
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+import random
+import zlib
+
+from telethon.errors import FloodWaitError
+
+_VOCAB = (
+    "market stocks shares oil prices inflation rates bank central government minister election "
+    "vote war troops border talks sanctions trade tariffs exports company profit loss revenue "
+    "quarter guidance startup funding ai chip data court ruling protest health vaccine hospital "
+    "energy gas climate emissions storm flood football league match season film music festival "
+    "said reported announced expected rose fell cut raised after before amid despite over under "
+    "the a of to in on for with by from and but as at this that its their new first more"
+).split()
+
+
+class FakeSender:
+    __slots__ = ("username", "first_name")
+
+    def __init__(self, username: Optional[str], first_name: Optional[str] = None):
+        self.username = username
+        self.first_name = first_name
+
+
+class FakeReplies:
+    __slots__ = ("replies",)
+
+    def __init__(self, replies: int):
+        self.replies = replies
+
+
+class FakeMessage:
+    __slots__ = ("id", "date", "message", "sender_id", "sender", "views", "forwards", "replies")
+
+    def __init__(self, id, date, message, sender_id, sender, views, forwards, replies):
+        self.id = id
+        self.date = date
+        self.message = message
+        self.sender_id = sender_id
+        self.sender = sender
+        self.views = views
+        self.forwards = forwards
+        self.replies = replies
+
+
+class SyntheticChannel:
+    """
+    A channel with ids 1..n_messages posted at roughly `messages_per_hour`.
+      - words_mean: mean text length in words (lognormal)
+      - dup_prob: share of messages that are lightly edited re-posts of a recent one
+      - missing_prob: share of messages missing views/forwards/replies/sender
+      - junk_prob: share of messages that are empty, a bare link or a single word
+    """
+
+    def __init__(
+        self,
+        name: str,
+        n_messages: int,
+        messages_per_hour: float = 20.0,
+        start_unix: int = 1704067200,
+        words_mean: float = 40.0,
+        dup_prob: float = 0.1,
+        missing_prob: float = 0.2,
+        junk_prob: float = 0.05,
+        seed: int = 0,
+    ):
+        self.name = name
+        self.n_messages = n_messages
+        self.interval = 3600.0 / messages_per_hour
+        self.start_unix = start_unix
+        self.words_mean = words_mean
+        self.dup_prob = dup_prob
+        self.missing_prob = missing_prob
+        self.junk_prob = junk_prob
+        self.seed = seed
+
+    def _rng(self, msg_id: int) -> random.Random:
+        return random.Random(f"{self.seed}:{self.name}:{msg_id}")
+
+    def date_unix(self, msg_id: int) -> int:
+        # Monotonic in id, like real channels; jitter stays within one interval
+        jitter = self._rng(msg_id).random() * 0.5 * self.interval
+        return int(self.start_unix + (msg_id - 1) * self.interval + jitter)
+
+    def _base_text(self, rng: random.Random) -> str:
+        n_words = max(3, int(rng.lognormvariate(0, 0.6) * self.words_mean))
+        return " ".join(rng.choice(_VOCAB) for _ in range(n_words)).capitalize() + "."
+
+    def text(self, msg_id: int) -> str:
+        rng = self._rng(msg_id)
+        rng.random()  # date jitter draw
+        r = rng.random()
+        if r < self.junk_prob:
+            return rng.choice(["", f"https://t.me/{self.name}/{msg_id}", rng.choice(_VOCAB)])
+        if r < self.junk_prob + self.dup_prob and msg_id > 1:
+            src = max(1, msg_id - rng.randint(1, 20))
+            base = self._base_text(self._rng(-src))
+            edit = rng.choice(["prefix", "link", "figure"])
+            if edit == "prefix":
+                return "UPDATE: " + base
+            if edit == "link":
+                return base + f" https://example.com/{msg_id}"
+            return base.replace(" the ", f" {rng.randint(2, 99)} ", 1)
+        return self._base_text(self._rng(-msg_id))
+
+    def message(self, msg_id: int) -> FakeMessage:
+        rng = self._rng(msg_id)
+        missing = lambda: rng.random() < self.missing_prob
+        views = None if missing() else rng.randint(100, 500000)
+        forwards = None if missing() else rng.randint(0, 5000)
+        replies = None if missing() else FakeReplies(rng.randint(0, 300))
+        sender = None if missing() else FakeSender(self.name)
+        return FakeMessage(
+            id=msg_id,
+            date=datetime.fromtimestamp(self.date_unix(msg_id), tz=timezone.utc),
+            message=self.text(msg_id),
+            sender_id=None if sender is None else -1000000000000 - zlib.crc32(self.name.encode()),
+            sender=sender,
+            views=views,
+            forwards=forwards,
+            replies=replies,
+        )
+
+    def id_before(self, when: datetime) -> int:
+        """
+        Highest id posted strictly before `when` (0 if none).
+        """
+        ts = when.timestamp()
+        guess = int((ts - self.start_unix) // self.interval) + 1
+        msg_id = min(max(guess, 0), self.n_messages)
+        while msg_id > 0 and self.date_unix(msg_id) >= ts:
+            msg_id -= 1
+        while msg_id < self.n_messages and self.date_unix(msg_id + 1) < ts:
+            msg_id += 1
+        return msg_id
+
+
+class FakeTelegramClient:
+    """
+    Implements iter_messages(channel, limit, min_id, max_id, offset_date, reverse) and
+    get_messages(...) over SyntheticChannels. Each call raises FloodWaitError
+    with probability `flood_wait_prob` (seconds=`flood_wait_seconds`).
+    """
+
+    def __init__(
+        self,
+        channels: List[SyntheticChannel],
+        flood_wait_prob: float = 0.0,
+        flood_wait_seconds: int = 1,
+        seed: int = 0,
+    ):
+        self.channels: Dict[str, SyntheticChannel] = {c.name: c for c in channels}
+        self.flood_wait_prob = flood_wait_prob
+        self.flood_wait_seconds = flood_wait_seconds
+        self._rng = random.Random(seed)
+        self.calls = 0
+
+    def _channel(self, entity: str) -> SyntheticChannel:
+        try:
+            return self.channels[entity]
+        except KeyError:
+            raise ValueError(f"No user has \"{entity}\" as username")
+
+    def _maybe_flood(self) -> None:
+        self.calls += 1
+        if self._rng.random() < self.flood_wait_prob:
+            raise FloodWaitError(request=None, capture=self.flood_wait_seconds)
+
+    async def iter_messages(
+        self,
+        entity: str,
+        limit: Optional[int] = None,
+        min_id: int = 0,
+        max_id: int = 0,
+        offset_date: Optional[datetime] = None,
+        reverse: bool = False,
+        **kwargs,
+    ) -> AsyncIterator[FakeMessage]:
+        ch = self._channel(entity)
+        self._maybe_flood()
+        top = ch.n_messages
+        if max_id:
+            top = min(top, max_id - 1)
+        if offset_date is not None:
+            top = min(top, ch.id_before(offset_date))
+        count = 0
+        ids = range(min_id + 1, top + 1) if reverse else range(top, min_id, -1)
+        for msg_id in ids:
+            if limit is not None and count >= limit:
+                return
+            yield ch.message(msg_id)
+            count += 1
+
+    async def get_messages(self, entity: str, limit: Optional[int] = None, **kwargs) -> List[FakeMessage]:
+        return [m async for m in self.iter_messages(entity, limit=limit, **kwargs)]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
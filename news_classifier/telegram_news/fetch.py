@@ -1,9 +1,11 @@
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Tuple
 from calendar import timegm
 from telethon.tl.types import Message
 import re
 import unicodedata
 
+from news_classifier.telegram_news.records import MessageRecord
+
 _MULTISPACE_RE = re.compile(r"[ ]{2,}")
 
 def sanitize_text(text: str) -> str:
@@ -26,49 +28,48 @@ def sanitize_text(text: str) -> str:
     
     return s
 
-def message_to_row(msg: Message) -> List[str]:
+def message_to_row(msg: Message) -> MessageRecord:
     """
     Each telegram is a row in the database.
     """
     # Store UTC unix timestamp for message date
-    if msg.date:
-        # Telethon msg.date is UTC; use timegm to avoid local TZ assumptions
-        date_unix = str(int(timegm(msg.date.utctimetuple())))
-    else:
-        date_unix = ""
-    sender_id = str(getattr(msg, "sender_id", "") or "")
-    sender_name = ""
+    # Telethon msg.date is UTC; use timegm to avoid local TZ assumptions
+    date_unix = int(timegm(msg.date.utctimetuple())) if msg.date else None
+    sender_name = None
     if hasattr(msg, "sender") and msg.sender:
         sender = msg.sender
-        sender_name = getattr(sender, "username", "") or getattr(sender, "first_name", "") or ""
-    views = getattr(msg, "views", None)
-    forwards = getattr(msg, "forwards", None)
-    replies = getattr(getattr(msg, "replies", None), "replies", None)
-    text = sanitize_text(msg.message or "")
-    return [
-        str(msg.id),
-        date_unix,
-        sender_id,
-        sender_name,
-        "" if views is None else str(views),
-        "" if forwards is None else str(forwards),
-        "" if replies is None else str(replies),
-        text,
-    ]
+        sender_name = getattr(sender, "username", None) or getattr(sender, "first_name", None) or None
+    return MessageRecord(
+        id=msg.id,
+        date_unix=date_unix,
+        sender_id=getattr(msg, "sender_id", None),
+        sender=sender_name,
+        views=getattr(msg, "views", None),
+        forwards=getattr(msg, "forwards", None),
+        replies=getattr(getattr(msg, "replies", None), "replies", None),
+        text=sanitize_text(msg.message or ""),
+    )
 
-async def fetch_new_rows(client, channel: str, min_id: int = 0, limit: Optional[int] = None) -> List[List[str]]:
+def keep_text(text: str) -> bool:
+    """
+    Empty text or text without spaces (links, single words, etc.) is not stored.
+    """
+    return text.strip() != "" and " " in text
+
+async def fetch_new_rows(client, channel: str, min_id: int = 0, limit: Optional[int] = None) -> List[MessageRecord]:
     """
     Fetch new messages from a channel with id > min_id and return rows suitable for DB insertion.
+    With a limit the oldest new messages are taken first, so the next run
+    resumes from the highest stored id without leaving a gap.
     """
-    rows: List[List[str]] = []
+    rows: List[MessageRecord] = []
     count = 0
-    async for msg in client.iter_messages(channel, limit=None, min_id=min_id):
+    async for msg in client.iter_messages(channel, limit=None, min_id=min_id, reverse=bool(limit)):
         if msg is None or getattr(msg, "id", None) is None:
             continue
         
         row = message_to_row(msg)
-        # Empty text or text without spaces (links, single words, etc.)
-        if row[-1].strip() == "" or not " " in row[-1]:
+        if not keep_text(row.text):
             continue
         rows.append(row)
         count += 1
@@ -76,4 +77,32 @@ async def fetch_new_rows(client, channel: str, min_id: int = 0, limit: Optional[
             break
     return rows
 
-
+async def iter_range_batches(
+    client,
+    channel: str,
+    min_id: int,
+    max_id: int,
+    batch_size: int = 500,
+) -> AsyncIterator[Tuple[List[MessageRecord], int]]:
+    """
+    Walk messages with min_id < id < max_id newest first and yield
+    (rows, cursor_id) batches, where cursor_id is the lowest id seen so far
+    (including messages dropped by keep_text) so a checkpoint can resume
+    from it with max_id=cursor_id without gaps.
+    """
+    rows: List[MessageRecord] = []
+    cursor_id = max_id
+    seen = 0
+    async for msg in client.iter_messages(channel, limit=None, min_id=min_id, max_id=max_id):
+        if msg is None or getattr(msg, "id", None) is None:
+            continue
+        cursor_id = min(cursor_id, msg.id)
+        seen += 1
+        row = message_to_row(msg)
+        if keep_text(row.text):
+            rows.append(row)
+        if seen >= batch_size:
+            yield rows, cursor_id
+            rows, seen = [], 0
+    if seen:
+        yield rows, cursor_id
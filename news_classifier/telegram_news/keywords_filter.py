@@ -1,19 +1,21 @@
 import os
 from typing import List
 
+from news_classifier.telegram_news.records import MessageRecord
+
 _KEYWORDS = []
 if os.path.exists(os.path.join(os.path.dirname(__file__), "keywords.txt")):
     with open(os.path.join(os.path.dirname(__file__), "keywords.txt"), "r", encoding="utf-8") as f:
         _KEYWORDS = [line.strip() for line in f if line.strip()]
 
-def keyword_filter(rows: List[List[str]]) -> List[List[str]]:
+def keyword_filter(rows: List[MessageRecord]) -> List[MessageRecord]:
     if not _KEYWORDS:
         return rows
         
-    filtered_rows: List[List[str]] = []
+    filtered_rows: List[MessageRecord] = []
     
     for row in rows:
-        text = row[7]
+        text = row.text
         if any(keyword in text for keyword in _KEYWORDS):
             filtered_rows.append(row)
     return filtered_rows
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+End-to-end ingestion load generator.
+
+Drives the real ingestion path (main.ingest_channels: fetch -> sanitize ->
+keyword filter -> insert -> near-duplicate index) against synthetic
+channels served by FakeTelegramClient, writing into a local PostgreSQL,
+and reports messages/s. Use a scratch database: the generated channels
+are named fake_<i> but rows are written to the regular tables.
+
+Usage:
+  createdb telegram_news_loadtest
+  python -m news_classifier.telegram_news.loadgen --channels 8 --messages 20000
+"""
+import asyncio
+import logging
+import time
+
+import psycopg2
+
+from news_classifier.telegram_news.database import ensure_dedup_tables, ensure_messages_table
+from news_classifier.telegram_news.fake_client import FakeTelegramClient, SyntheticChannel
+from news_classifier.telegram_news.main import ingest_channels
+
+logger = logging.getLogger(__name__)
+
+
+def reset_channels(conn, channels) -> None:
+    cur = conn.cursor()
+    for table in ("message_lsh_bucket", "message_minhash", "messages"):
+        cur.execute(f"DELETE FROM {table} WHERE channel = ANY(%s::text[])", (list(channels),))
+    conn.commit()
+
+
+def main() -> None:
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dsn", default="postgresql://ian@localhost:5432/telegram_news_loadtest")
+    parser.add_argument("--channels", type=int, default=4, help="Number of synthetic channels")
+    parser.add_argument("--messages", type=int, default=10000, help="Messages per channel")
+    parser.add_argument("--rate", type=float, default=20.0, help="Messages per hour per channel")
+    parser.add_argument("--dup-prob", type=float, default=0.1)
+    parser.add_argument("--missing-prob", type=float, default=0.2)
+    parser.add_argument("--junk-prob", type=float, default=0.05)
+    parser.add_argument("--flood-prob", type=float, default=0.0, help="FloodWaitError probability per request")
+    parser.add_argument("--flood-seconds", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None, help="Max messages per channel per run")
+    parser.add_argument("--runs", type=int, default=1, help="Ingestion passes; with --limit each pass continues oldest-first from the last stored id")
+    parser.add_argument("--keep", action="store_true", help="Keep rows from previous load tests")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    channels = [
+        SyntheticChannel(
+            f"fake_{i}",
+            args.messages,
+            messages_per_hour=args.rate,
+            dup_prob=args.dup_prob,
+            missing_prob=args.missing_prob,
+            junk_prob=args.junk_prob,
+            seed=args.seed,
+        )
+        for i in range(args.channels)
+    ]
+    names = [c.name for c in channels]
+    client = FakeTelegramClient(
+        channels, flood_wait_prob=args.flood_prob, flood_wait_seconds=args.flood_seconds, seed=args.seed
+    )
+
+    conn = psycopg2.connect(args.dsn)
+    ensure_messages_table(conn)
+    ensure_dedup_tables(conn)
+    if not args.keep:
+        reset_channels(conn, names)
+
+    totals = {"fetched": 0, "kept": 0, "inserted": 0}
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        run = asyncio.run(ingest_channels(client, conn, names, limit=args.limit))
+        for k in totals:
+            totals[k] += run[k]
+    elapsed = time.perf_counter() - start
+    conn.close()
+
+    print(
+        f"channels={args.channels} messages/channel={args.messages} runs={args.runs} "
+        f"requests={client.calls}"
+    )
+    print(
+        f"fetched={totals['fetched']} kept={totals['kept']} inserted={totals['inserted']} "
+        f"elapsed={elapsed:.2f}s"
+    )
+    print(
+        f"throughput: {totals['fetched'] / elapsed:.0f} fetched msg/s, "
+        f"{totals['inserted'] / elapsed:.0f} inserted msg/s"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
@@ -1,7 +1,7 @@
 import os
 import sys
 import time
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 import logging
 import psycopg2
 
@@ -9,9 +9,16 @@ from dotenv import load_dotenv
 from telethon import TelegramClient
 from telethon.errors import ChannelPrivateError, UsernameInvalidError, FloodWaitError
 
-from database import ensure_messages_table, get_last_saved_id, insert_rows
-from fetch import fetch_new_rows
-from keywords_filter import keyword_filter
+from news_classifier.telegram_news.database import (
+    ensure_messages_table,
+    ensure_dedup_tables,
+    get_last_saved_id,
+    insert_rows,
+)
+from news_classifier.telegram_news.dedup import assign_clusters, CLUSTER_THRESHOLD
+from news_classifier.telegram_news.fetch import fetch_new_rows
+from news_classifier.telegram_news.keywords_filter import keyword_filter
+from news_classifier.telegram_news.records import MessageRecord
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -47,16 +54,70 @@ def read_channels(file_path: str) -> List[str]:
     return channels
 
 
+def store_rows(
+    conn,
+    channel: str,
+    rows: List[MessageRecord],
+    dedup_threshold: float = CLUSTER_THRESHOLD,
+) -> Tuple[int, int, int]:
+    """
+    Keyword-filter, insert and index fetched rows of one channel.
+    Idempotent: stored or indexed messages are skipped.
+    Returns (kept, inserted, near_duplicates).
+    """
+    keyword_filtered_rows = keyword_filter(rows)
+    inserted = insert_rows(conn, channel, keyword_filtered_rows)
+    _, near_dups = assign_clusters(
+        conn, channel, [(r.id, r.text) for r in keyword_filtered_rows], dedup_threshold
+    )
+    return len(keyword_filtered_rows), inserted, near_dups
+
+
+async def ingest_channels(
+    client,
+    conn,
+    channels: List[str],
+    limit: int | None = None,
+    dedup_threshold: float = CLUSTER_THRESHOLD,
+) -> Dict[str, int]:
+    """
+    Fetch, filter, insert and index new messages for each channel.
+    Returns totals: {'fetched', 'kept', 'inserted'}.
+    """
+    totals = {"fetched": 0, "kept": 0, "inserted": 0}
+    for ch in channels:
+        try:
+            last_id = get_last_saved_id(conn, ch)
+            rows = await fetch_new_rows(client, ch, min_id=last_id, limit=limit)
+            kept, inserted, near_dups = store_rows(conn, ch, rows, dedup_threshold)
+            totals["fetched"] += len(rows)
+            totals["kept"] += kept
+            totals["inserted"] += inserted
+            logger.info(f"[{ch}] +{inserted} insertedmessages (fetched {len(rows)}, passed keyword filter {kept}, near-duplicates {near_dups})")
+
+        except FloodWaitError as e:
+            logger.info(f"[{ch}] rate limited: waiting {e.seconds}s ...")
+            time.sleep(e.seconds)
+        except (ChannelPrivateError, UsernameInvalidError) as e:
+            logger.warning(f"[{ch}] skipped: {e.__class__.__name__}: {e}")
+        except Exception as e:
+            logger.error(f"[{ch}] error: {e}")
+    return totals
+
+
 def main() -> None:
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--channels", default=os.path.join(os.path.dirname(__file__), "channels.txt"))
-    parser.add_argument("--limit", type=int, default=None, help="Max messages per channel in this run")
+    parser.add_argument("--limit", type=int, default=None, help="Max messages per channel in this run (oldest new messages first)")
+    parser.add_argument("--dedup-threshold", type=float, default=CLUSTER_THRESHOLD,
+                        help="Min MinHash similarity to join an existing near-duplicate cluster")
     args = parser.parse_args()
 
     api_id, api_hash, phone, session_name = load_env()
     conn = psycopg2.connect("postgresql://ian@localhost:5432/telegram_news")
     ensure_messages_table(conn)
+    ensure_dedup_tables(conn)
 
     channels = read_channels(args.channels)
     if not channels:
@@ -69,24 +130,10 @@ def main() -> None:
     else:
         client = client.start()
 
-    async def runner():
-        for ch in channels:
-            try:
-                last_id = get_last_saved_id(conn, ch)
-                rows = await fetch_new_rows(client, ch, min_id=last_id, limit=args.limit)
-                keyword_filtered_rows = keyword_filter(rows)
-                inserted = insert_rows(conn, ch, keyword_filtered_rows)
-                logger.info(f"[{ch}] +{inserted} insertedmessages (fetched {len(rows)}, passed keyword filter {len(keyword_filtered_rows)})")
-            
-            except FloodWaitError as e:
-                logger.info(f"[{ch}] rate limited: waiting {e.seconds}s ...")
-                time.sleep(e.seconds)
-            except (ChannelPrivateError, UsernameInvalidError) as e:
-                logger.warning(f"[{ch}] skipped: {e.__class__.__name__}: {e}")
-            except Exception as e:
-                logger.error(f"[{ch}] error: {e}")
     with client:
-        client.loop.run_until_complete(runner())
+        client.loop.run_until_complete(
+            ingest_channels(client, conn, channels, limit=args.limit, dedup_threshold=args.dedup_threshold)
+        )
     conn.close()
 
 
@@ -0,0 +1,36 @@
+"""
+Typed message records for the ingestion path.
+
+MessageRecord carries native values straight from Telethon to the DB writer
+(ints, or None when Telegram has no value). MessageBatch is the columnar
+form used by bulk inserts: one tuple per column instead of one tuple per row.
+"""
+from typing import NamedTuple, Sequence, Tuple
+
+
+class MessageRecord(NamedTuple):
+    id: int
+    date_unix: int | None   # UTC seconds since epoch
+    sender_id: int | None   # Telegram internal sender id
+    sender: str | None      # username or first_name
+    views: int | None
+    forwards: int | None
+    replies: int | None
+    text: str               # sanitized message body
+
+
+class MessageBatch(NamedTuple):
+    id: Tuple[int, ...]
+    date_unix: Tuple[int | None, ...]
+    sender_id: Tuple[int | None, ...]
+    sender: Tuple[str | None, ...]
+    views: Tuple[int | None, ...]
+    forwards: Tuple[int | None, ...]
+    replies: Tuple[int | None, ...]
+    text: Tuple[str, ...]
+
+    @classmethod
+    def from_records(cls, records: Sequence[MessageRecord]) -> "MessageBatch":
+        if not records:
+            return cls(*([()] * len(cls._fields)))
+        return cls(*zip(*records))
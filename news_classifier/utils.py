@@ -43,7 +43,7 @@ def get_db_news(
         SELECT m.*
         FROM messages m
         LEFT JOIN {table} t
-          ON t.channel = m.channel AND t.id = m.id
+          ON t.channel = m.channel AND t.id = m.id AND t.date_unix = m.date_unix
         WHERE t.channel IS NULL
         """
         params: list = []
@@ -64,4 +64,118 @@ def get_db_news(
         return news
     except Exception as e:
         logger.error(f"Error getting news: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+
+def plan_score_reuse(
+    conn: PGConnection,
+    news: pd.DataFrame,
+    table: str,
+    score_cols: Sequence[str],
+    min_similarity: float,
+) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Split pending news into rows that need inference and near-duplicates whose
+    scores can be copied from their cluster representative (message_minhash).
+    A follower is reused when its similarity to the representative is at least
+    min_similarity and the representative is either already scored in `table`
+    (for message_tag: on every label in score_cols, read from
+    message_tag_score) or is itself part of `news` (so it gets scored in this run).
+    Returns (to_score, followers[channel,id,date_unix,cluster_channel,cluster_id], rep_scores).
+    """
+    allowed_tables = ["message_sentiment", "message_tag"]
+    if table not in allowed_tables:
+        raise ValueError(f"Invalid table: {table}. Allowed tables are: {allowed_tables}")
+    empty = pd.DataFrame(columns=["channel", "id", "date_unix", "cluster_channel", "cluster_id"])
+    if news.empty:
+        return news, empty, pd.DataFrame(columns=["channel", "id", *score_cols])
+    cols = ", ".join(f"s.{c}" for c in score_cols)
+    try:
+        followers = pd.read_sql_query(
+            """
+            SELECT h.channel, h.id, q.date_unix, h.cluster_channel, h.cluster_id
+            FROM message_minhash h
+            JOIN unnest(%s::text[], %s::bigint[], %s::bigint[]) AS q(channel, id, date_unix)
+              ON h.channel = q.channel AND h.id = q.id
+            WHERE (h.channel, h.id) <> (h.cluster_channel, h.cluster_id)
+              AND h.similarity >= %s
+            """,
+            conn,
+            params=[
+                news["channel"].astype(str).tolist(),
+                news["id"].astype(int).tolist(),
+                news["date_unix"].astype(int).tolist(),
+                float(min_similarity),
+            ],
+        )
+        reps = """
+            SELECT DISTINCT h.cluster_channel, h.cluster_id
+            FROM message_minhash h
+            JOIN unnest(%s::text[], %s::bigint[]) AS q(channel, id)
+              ON h.channel = q.channel AND h.id = q.id
+        """
+        keys = [news["channel"].astype(str).tolist(), news["id"].astype(int).tolist()]
+        if table == "message_sentiment":
+            rep_scores = pd.read_sql_query(
+                f"""
+                SELECT s.channel, s.id, {cols}
+                FROM message_sentiment s
+                JOIN ({reps}) c ON s.channel = c.cluster_channel AND s.id = c.cluster_id
+                """,
+                conn,
+                params=keys,
+            )
+        else:
+            # Pivot the representatives' rows of message_tag_score instead of
+            # going through the message_tag view, and only reuse representatives
+            # scored on every requested label
+            pivot = ", ".join(f'MAX(s.score) FILTER (WHERE l.column_name = %s) AS "{c}"' for c in score_cols)
+            rep_scores = pd.read_sql_query(
+                f"""
+                SELECT s.channel, s.id, {pivot}
+                FROM message_tag_score s
+                JOIN tag_label l ON l.label_id = s.label_id
+                JOIN ({reps}) c ON s.channel = c.cluster_channel AND s.id = c.cluster_id
+                WHERE l.column_name = ANY(%s::text[])
+                GROUP BY s.channel, s.id
+                HAVING COUNT(DISTINCT s.label_id) = %s
+                """,
+                conn,
+                params=[*score_cols, *keys, list(score_cols), len(score_cols)],
+            )
+    except Exception as e:
+        # No dedup index yet (or it is unreadable): score everything
+        logger.warning(f"Score reuse disabled: {e}")
+        conn.rollback()
+        return news, empty, pd.DataFrame(columns=["channel", "id", *score_cols])
+
+    rep_keys = pd.MultiIndex.from_frame(followers[["cluster_channel", "cluster_id"]])
+    available = pd.MultiIndex.from_frame(rep_scores[["channel", "id"]]).union(
+        pd.MultiIndex.from_frame(news[["channel", "id"]])
+    )
+    followers = followers[rep_keys.isin(available)].reset_index(drop=True)
+    follower_keys = pd.MultiIndex.from_frame(followers[["channel", "id"]])
+    to_score = news[~pd.MultiIndex.from_frame(news[["channel", "id"]]).isin(follower_keys)]
+    return to_score.reset_index(drop=True), followers, rep_scores
+
+
+def apply_score_reuse(
+    scored: pd.DataFrame,
+    followers: pd.DataFrame,
+    rep_scores: pd.DataFrame,
+    score_cols: Sequence[str],
+) -> pd.DataFrame:
+    """
+    Append follower rows to freshly scored rows, copying each follower's scores
+    from its representative (scored in this run or already stored).
+    """
+    if followers.empty:
+        return scored
+    pool = pd.concat([rep_scores, scored], ignore_index=True) if not scored.empty else rep_scores
+    pool = pool[["channel", "id", *score_cols]].drop_duplicates(subset=["channel", "id"], keep="last")
+    pool = pool.rename(columns={"channel": "cluster_channel", "id": "cluster_id"})
+    copied = followers.merge(pool, on=["cluster_channel", "cluster_id"], how="inner")
+    copied = copied[["channel", "id", "date_unix", *score_cols]]
+    if scored.empty:
+        return copied.reset_index(drop=True)
+    return pd.concat([scored, copied], ignore_index=True)